@@ -0,0 +1,168 @@
+"""
+Кэширование ответов API.
+
+Справочные эндпоинты (теги, ингредиенты). Отрендеренный JSON хранится
+в двух уровнях: в памяти процесса (LRU с TTL) и в пространстве имён
+reference_data общего кэша (recipes.cache). Уровни включаются
+независимо. Ключи содержат версию группы справочника, поэтому при её
+смене старые ответы просто перестают находиться и вытесняются сами.
+Без общего кэша версия своя у каждого процесса, и изменение,
+сделанное в другом воркере, видно после истечения TTL в памяти.
+ETag - хэш содержимого, он не зависит от версии конкретного процесса.
+
+Детальное представление рецепта. Кэшируется часть, одинаковая для всех
+пользователей: рецепт (recipe_data) и профиль автора (user_data)
+хранятся раздельно, чтобы изменение профиля не требовало сброса всех
+рецептов автора. Флаги текущего пользователя добавляет view.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import RecipeReadSerializer, UserModelSerializer
+from recipes.cache import (
+    INGREDIENTS, TAGS, recipe_data, recipe_group, reference_data,
+    user_data, user_group)
+from recipes.models import UserModel
+
+# Сколько ответов держать в памяти процесса
+LOCAL_CACHE_SIZE = 256
+
+
+class _LocalCache:
+    """Потокобезопасный LRU-кэш в памяти процесса с TTL записей."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_local_cache = _LocalCache(LOCAL_CACHE_SIZE)
+
+
+class ReferenceDataCacheMixin:
+    """
+    Кэширует JSON-ответы list/retrieve справочного ViewSet
+    и отдаёт ETag для ответов 304.
+    cache_group - группа инвалидации справочника из recipes.cache.
+    """
+    cache_group = None
+
+    def list(self, request, *args, **kwargs):
+        build = super().list
+        return self._cached_response(
+            request, lambda: build(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+        return self._cached_response(
+            request, lambda: build(request, *args, **kwargs))
+
+    def _cached_response(self, request, build):
+        """
+        Возвращает закэшированный ответ или строит его через build().
+        Кэшируются только JSON-ответы со статусом 200.
+        """
+        local_ttl = settings.REFERENCE_DATA_LOCAL_TTL
+        if (not (reference_data.enabled or local_ttl)
+                or request.accepted_renderer.format != 'json'):
+            return build()
+
+        version = reference_data.group_version(self.cache_group)
+        # Строка запроса приходит от клиента: пробелы, управляющие
+        # символы и длина недопустимы в ключах memcached
+        key = '{}:{}'.format(self.action, hashlib.sha1(
+            request.get_full_path().encode()).hexdigest())
+        local_key = (self.cache_group, key)
+
+        cached = _local_cache.get(local_key) if local_ttl else None
+        if cached is not None and cached[0] == version:
+            content, etag = cached[1:]
+        else:
+            content = reference_data.get(key, group=self.cache_group,
+                                         version=version)
+            if content is None:
+                response = build()
+                if response.status_code != 200:
+                    return response
+                content = JSONRenderer().render(response.data)
+                # Версия прочитана до build(): если справочник изменили
+                # во время построения, ответ уйдёт под старую версию
+                reference_data.set(key, content, group=self.cache_group,
+                                   version=version)
+            etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+            if local_ttl:
+                _local_cache.set(local_key, (version, content, etag),
+                                 local_ttl)
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+def get_recipe_representation(queryset, pk):
+    """
+    Возвращает не зависящее от пользователя представление рецепта.
+    Поле author содержит id автора, ссылки на изображения - относительные.
+    Ключ включает версии тегов и ингредиентов: их переименование
+    меняет представление всех рецептов.
+    """
+    group = recipe_group(pk)
+    # Версии читаются до запроса к БД (см. foodgram/cache.py)
+    version = recipe_data.group_version(group)
+    key = 'detail:{}:{}'.format(reference_data.group_version(TAGS),
+                                reference_data.group_version(INGREDIENTS))
+    data = recipe_data.get(key, group=group, version=version)
+    if data is None:
+        # Без request в контексте флаги пользователя не вычисляются,
+        # а ImageField отдаёт относительные ссылки. Профиль автора
+        # кэширует get_author_profile() под версией, прочитанной
+        # до своего запроса
+        data = dict(RecipeReadSerializer(
+            get_object_or_404(queryset, pk=pk)).data)
+        data['author'] = data['author']['id']
+        recipe_data.set(key, data, group=group, version=version)
+    return dict(data)
+
+
+def get_author_profile(user_id):
+    """Возвращает публичный профиль пользователя без is_subscribed."""
+    group = user_group(user_id)
+    version = user_data.group_version(group)
+    profile = user_data.get('profile', group=group, version=version)
+    if profile is None:
+        profile = dict(UserModelSerializer(
+            get_object_or_404(UserModel, pk=user_id)).data)
+        user_data.set('profile', profile, group=group, version=version)
+    return dict(profile)
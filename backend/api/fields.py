@@ -0,0 +1,113 @@
+import base64
+import binascii
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+
+# Размер части base64-строки для декодирования, кратен 4
+DECODE_CHUNK = 64 * 1024
+# Сколько держать в памяти до сброса временного файла на диск
+SPOOL_MAX_SIZE = 1024 * 1024
+# Формат Pillow -> расширение файла
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+
+
+class Base64ImageField(serializers.ImageField):
+    """
+    Картинка в base64 ("data:image/png;base64,...").
+
+    Строка декодируется частями во временный файл, который при
+    большом размере уходит на диск, поэтому в памяти не появляется
+    вторая полная копия картинки. Проверяются только заголовок
+    и размеры изображения, без полного декодирования пикселей:
+    уменьшенные копии строятся в фоне (recipes/images.py).
+    """
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'invalid_type': 'Поддерживаются изображения JPEG, PNG, GIF и WebP.',
+        'too_large': 'Размер изображения больше допустимого.',
+    }
+
+    def to_internal_value(self, data):
+        if data in (None, ''):
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_image')
+        if ';base64,' in data:
+            data = data.split(';base64,', 1)[1]
+        # Клиенты переносят длинные base64-строки: с validate=True
+        # пробелы и переводы строк внутри части были бы ошибкой
+        data = ''.join(data.split())
+        if len(data) * 3 // 4 > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.fail('too_large')
+
+        content = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        valid = False
+        try:
+            for start in range(0, len(data), DECODE_CHUNK):
+                content.write(base64.b64decode(
+                    data[start:start + DECODE_CHUNK], validate=True))
+            content.seek(0)
+            extension = self._check_image(content)
+            valid = True
+        except (binascii.Error, ValueError):
+            self.fail('invalid_image')
+        finally:
+            if not valid:
+                content.close()
+        content.seek(0)
+        return File(content, name=f'{uuid.uuid4().hex[:12]}.{extension}')
+
+    def _check_image(self, content):
+        """Проверяет формат и размеры, возвращает расширение файла."""
+        try:
+            with Image.open(content) as image:
+                image_format = image.format
+                width, height = image.size
+                image.verify()
+        except Exception:
+            # Pillow сообщает о повреждённых файлах разными исключениями
+            self.fail('invalid_image')
+        if image_format not in IMAGE_EXTENSIONS:
+            self.fail('invalid_type')
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail('too_large')
+        return IMAGE_EXTENSIONS[image_format]
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии изображения:
+    {"card": {"webp": "...", "jpeg": "..."}, ...}.
+    Пока копии не построены, отдаётся пустой объект и клиент
+    использует оригинал. image_field - поле модели с оригиналом,
+    из него берётся хранилище.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = self.parent.Meta.model._meta.get_field(
+            self.image_field).storage
+        request = self.context.get('request')
+        variants = {}
+        for variant, files in (value or {}).items():
+            if variant == 'source':
+                continue
+            variants[variant] = {}
+            for image_format, name in files.items():
+                url = storage.url(name)
+                variants[variant][image_format] = (
+                    request.build_absolute_uri(url) if request else url)
+        return variants
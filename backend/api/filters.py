@@ -1,22 +1,32 @@
+from django.db.models import (
+    Case, Exists, IntegerField, OuterRef, Value, When)
 from django_filters import rest_framework as filters
 from django_filters import CharFilter
 
-from recipes.models import Recipe, Tag, Ingredient
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart, Tag)
 
 
 class RecipeFilter(filters.FilterSet):
+    """
+    Фильтры по связанным таблицам выполняются подзапросами EXISTS,
+    а не JOIN: так рецепт не дублируется при нескольких совпадениях
+    и DISTINCT не нужен. Подзапросы обслуживаются индексами
+    recipe_tags_tag_recipe_idx, (user, recipe) избранного и корзины
+    и триграммным индексом названий ингредиентов.
+    """
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name="tags__slug",
-        to_field_name="slug"  # Сопоставление по slug
+        to_field_name="slug",  # Сопоставление по slug
+        method="filter_tags"
     )
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart")
 
     ingredient_name = CharFilter(
-        field_name="ingredients__name",  # Поле, по которому будет фильтрация
-        lookup_expr="icontains",  # Поиск без учета регистра и по вхождению
+        method="filter_ingredient_name",
         label="Поиск по названию ингредиента"
     )
 
@@ -25,6 +35,15 @@ class RecipeFilter(filters.FilterSet):
         fields = ("tags", "author", "is_favorited",
                   "is_in_shopping_cart", "ingredient_name")
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты, у которых есть хотя бы один из выбранных тегов.
+        """
+        if not value:  # Пустая выборка тегов, если параметр не передан
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__in=value)))
+
     def filter_is_favorited(self, queryset, name, value):
         """
         Фильтрация рецептов по состоянию "избранное" для текущего пользователя.
@@ -32,7 +51,8 @@ class RecipeFilter(filters.FilterSet):
         user = self.request.user
         # Если рецепты должны быть в избранном
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return queryset  # Если пользователь не аутентифицирован,
         # просто возвращаем все рецепты
 
@@ -44,14 +64,37 @@ class RecipeFilter(filters.FilterSet):
         user = self.request.user
         if value and user.is_authenticated:  # Если рецепты должны быть
             # в корзине покупок
-            return queryset.filter(in_cart__user=user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return queryset  # Если пользователь не аутентифицирован,
         # просто возвращаем все рецепты
 
+    def filter_ingredient_name(self, queryset, name, value):
+        """
+        Поиск рецептов по вхождению строки в название ингредиента
+        без учета регистра.
+        """
+        return queryset.filter(Exists(IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk'), ingredient__name__icontains=value)))
+
 
 class IngredientFilter(filters.FilterSet):
-    name = filters.CharFilter(field_name='name', lookup_expr='icontains')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        """
+        Поиск для автодополнения: ингредиенты, начинающиеся с введённой
+        строки, идут раньше тех, что содержат её в середине названия.
+        Оба условия обслуживаются триграммным индексом по UPPER(name).
+        """
+        return queryset.filter(name__icontains=value).annotate(
+            match_rank=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('match_rank', 'name')
@@ -1,8 +1,174 @@
+import base64
+import binascii
+import json
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class Pagination(PageNumberPagination):
     page_size = settings.PAGE_SIZE  # Значение по умолчанию
     page_size_query_param = 'limit'
     max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация для бесконечной ленты.
+
+    Выборка сортируется по ordering, последним полем которого должен
+    быть уникальный ключ (id), а следующая страница выбирается условием
+    "после последней строки" вместо OFFSET, поэтому её стоимость
+    не зависит от глубины. COUNT(*) не выполняется; с параметром
+    ?count=estimate в ответ добавляется оценка числа строк
+    из статистики планировщика PostgreSQL.
+    """
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def __init__(self, ordering):
+        self.ordering = tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        queryset = queryset.order_by(*self.ordering)
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count = estimate_count(queryset)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            cursor = self._clean_position(queryset, cursor)
+            queryset = queryset.filter(self._after(cursor))
+
+        # Берём на одну строку больше, чтобы узнать, есть ли продолжение
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = (
+            [self._value(page[-1], field) for field in self.ordering]
+            if self.has_next else None)
+        return page
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, default=str).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def _clean_position(self, queryset, position):
+        """
+        Приводит значения курсора к типам полей сортировки. Курсор
+        приходит от клиента: значение не того типа - ошибка 404,
+        а не исключение в ORM.
+        """
+        cleaned = []
+        for field_name, value in zip(self.ordering, position):
+            field = _ordering_field(queryset, field_name.lstrip('-'))
+            if value is None and getattr(field, 'null', False):
+                cleaned.append(None)
+                continue
+            if (isinstance(value, bool)
+                    or not isinstance(value, (str, int, float))):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def _after(self, position):
+        """
+        Условие "строго после position" для сортировки ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def _value(obj, field):
+        return getattr(obj, field.lstrip('-'))
+
+
+def _ordering_field(queryset, name):
+    """Поле модели или аннотации, по которому идёт сортировка."""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк выборки по плану запроса PostgreSQL.
+    На других СУБД выполняется обычный COUNT(*).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def select_pagination(request, keyset_ordering):
+    """
+    Возвращает пагинатор для запроса: курсорный при
+    ?pagination=cursor, иначе постраничный.
+    """
+    if request.query_params.get('pagination') == 'cursor':
+        return KeysetPagination(keyset_ordering)
+    return Pagination()
@@ -0,0 +1,97 @@
+"""
+Разреженные наборы полей: параметр ?fields=id,name оставляет в ответе
+только перечисленные поля, ?omit=text,ingredients - все, кроме
+перечисленных. Параметры относятся к полям верхнего уровня ответа.
+View по выбранным полям загружает только нужные столбцы и пропускает
+ненужные prefetch и аннотации.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Сериализатор с аргументом fields: остальные поля удаляются
+    до сериализации и не вычисляются.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """
+    Передаёт поля, выбранные ?fields= и ?omit=, в сериализатор для
+    действий sparse_fields_actions и строит по ним список столбцов
+    для only().
+    """
+    sparse_fields_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        """
+        Выбранные поля или None, если ни ?fields=, ни ?omit=
+        не переданы. Неизвестные имена полей - ошибка 400.
+        """
+        if self.action not in self.sparse_fields_actions:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            all_fields = set(self.get_serializer_class()().fields)
+            fields = self._parse_fields_param(FIELDS_PARAM, all_fields)
+            omit = self._parse_fields_param(OMIT_PARAM, all_fields)
+            self._sparse_fields = (
+                None if fields is None and omit is None
+                else (fields or all_fields) - (omit or set()))
+        return self._sparse_fields
+
+    def _parse_fields_param(self, param, all_fields):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        fields = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = fields - all_fields
+        if unknown:
+            raise ValidationError(
+                {param: 'Неизвестные поля: ' + ', '.join(sorted(unknown))})
+        return fields
+
+    def wants_field(self, name):
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_projected_columns(self):
+        """Столбцы модели, которые читает сериализатор с учётом выбора."""
+        serializer = self.get_serializer_class()(
+            fields=self.get_sparse_fields())
+        return model_columns(serializer)
+
+
+def model_columns(serializer):
+    """
+    Имена полей модели, из которых читают поля сериализатора.
+    Поля с вычисляемым источником (SerializerMethodField, source='*')
+    и связи многие-ко-многим не учитываются.
+    """
+    model = serializer.Meta.model
+    columns = {model._meta.pk.name}
+    for field in serializer.fields.values():
+        if field.source == '*':
+            continue
+        try:
+            model_field = model._meta.get_field(field.source.split('.')[0])
+        except FieldDoesNotExist:
+            continue
+        if model_field.concrete and not model_field.many_to_many:
+            columns.add(model_field.name)
+    return columns
@@ -1,9 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.forms import ValidationError
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from api.fields import Base64ImageField, ImageVariantsField
+from api.projection import SparseFieldsSerializerMixin
 from recipes.models import (
     Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
     Subscription, Tag, UserModel)
@@ -11,28 +12,48 @@ from recipes.models import (
 User = get_user_model()
 
 
-class UserModelSerializer(serializers.ModelSerializer):
+class UserModelSerializer(SparseFieldsSerializerMixin,
+                          serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField(image_field='avatar')
 
     class Meta:
         model = UserModel  # Замените на вашу модель пользователя
         fields = ['email', 'id', 'username', 'first_name',
-                  'last_name', 'is_subscribed', 'avatar']
+                  'last_name', 'is_subscribed', 'avatar', 'avatar_variants']
 
     def get_is_subscribed(self, obj):
         """
         Метод для проверки, подписан ли текущий
         пользователь на данного пользователя.
+        Значение, аннотированное в UsersViewSet, используется
+        без обращения к БД.
         """
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
         return bool(
-            self.context.get('request') and (
-                self.context['request'].user.is_authenticated
-            ) and Subscription.objects.filter(
-                user=self.context['request'].user,
-                subscribed_to=obj
-            ).exists()
+            request
+            and request.user.is_authenticated
+            and obj.pk in self._get_subscribed_ids(request)
         )
 
+    @staticmethod
+    def _get_subscribed_ids(request):
+        """
+        Возвращает множество id авторов, на которых подписан текущий
+        пользователь. Загружается одним запросом и хранится в объекте
+        запроса, поэтому все сериализуемые в нём пользователи
+        проверяются без обращения к БД.
+        """
+        if not hasattr(request, '_subscribed_ids'):
+            request._subscribed_ids = set(
+                Subscription.objects.filter(
+                    user=request.user
+                ).values_list('subscribed_to_id', flat=True)
+            )
+        return request._subscribed_ids
+
 
 class AvatarUpdateSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True)
@@ -94,9 +115,11 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'amount']
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsSerializerMixin,
+                           serializers.ModelSerializer):
     # Поля для работы с изображением и автором рецепта
-    image = Base64ImageField(read_only=True)
+    image = serializers.ImageField(read_only=True)
+    image_variants = ImageVariantsField(image_field='image')
     author = UserModelSerializer(read_only=True)
 
     # Используем IngredientInRecipeReadSerializer для вложенных ингредиентов
@@ -124,6 +147,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         )
@@ -132,7 +156,11 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         """
         Проверяем, добавил ли текущий пользователь рецепт в избранное.
         Возвращаем False для анонимных пользователей.
+        Если рецепт получен из аннотированной выборки RecipeViewSet,
+        используем готовое значение без дополнительного запроса.
         """
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (
             request
@@ -144,7 +172,10 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         """
         Проверяем, находится ли рецепт в корзине покупок текущего пользователя.
         Возвращаем результат логического выражения.
+        Аннотированное значение используется, если оно есть.
         """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request
@@ -227,10 +258,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags')
 
         # Создаем рецепт
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user,
-            **validated_data
-        )
+        author = self.context['request'].user
+        recipe = Recipe.objects.create(author=author, **validated_data)
 
         # Устанавливаем теги
         recipe.tags.set(tags_data)
@@ -280,51 +309,53 @@ class RecipeSerializer(serializers.ModelSerializer):
         return representation
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(SparseFieldsSerializerMixin,
+                            serializers.ModelSerializer):
     """
     Сериализатор для краткой информации о рецепте.
     """
     image = serializers.ImageField()
+    image_variants = ImageVariantsField(image_field='image')
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_variants', 'cooking_time']
+
+
+def get_recipes_limit(request):
+    """Параметр recipes_limit: неотрицательное целое число или None."""
+    value = request.query_params.get('recipes_limit')
+    if not value:
+        return None
+    try:
+        return serializers.IntegerField(min_value=0).run_validation(value)
+    except serializers.ValidationError as error:
+        raise serializers.ValidationError({'recipes_limit': error.detail})
 
 
 class SubscribedUsersSerializer(UserModelSerializer):
-    recipes_count = serializers.SerializerMethodField()
+    # Денормализованный счётчик - обычное поле модели
+    recipes_count = serializers.IntegerField(read_only=True)
     recipes = serializers.SerializerMethodField()
 
     class Meta:
         model = UserModel  # Модель, которая будет сериализована (UserModel)
         fields = ['email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed',
-                  'recipes', 'recipes_count', 'avatar']
-
-    def get_recipes_count(self, obj):
-        """
-        Метод для подсчёта количества рецептов у пользователя.
-        """
-        return obj.recipes.count()
+                  'recipes', 'recipes_count', 'avatar', 'avatar_variants']
 
     def get_recipes(self, obj):
         """
         Метод для получения рецептов с ограничением по числу,
         используя параметр recipes_limit.
+        Если превью рецептов предзагружены во view (recipe_previews),
+        повторный запрос не выполняется.
         """
-        recipes_limit = self.context.get(
-            'request').query_params.get('recipes_limit')
-
-        recipes_query = obj.recipes.all()
-        if recipes_limit:
-            recipes_query = recipes_query[:int(recipes_limit)]
-
-        recipes_data = RecipeReadSerializer(recipes_query, many=True).data
-
-        fields_to_include = ['id', 'name', 'image', 'cooking_time']
-        filtered_recipes = [
-            {field: recipe.get(field) for field in fields_to_include}
-            for recipe in recipes_data
-        ]
-
-        return filtered_recipes
+        recipes_query = getattr(obj, 'recipe_previews', None)
+        if recipes_query is None:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes_query = obj.recipes.all()
+            if recipes_limit is not None:
+                recipes_query = recipes_query[:recipes_limit]
+
+        return RecipeShortSerializer(recipes_query, many=True).data
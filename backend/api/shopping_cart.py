@@ -0,0 +1,81 @@
+"""
+Потоковая выгрузка списка покупок в разных форматах.
+"""
+import csv
+import json
+
+# Сколько строк читать из курсора и отправлять клиенту за один раз
+CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def _rows(ingredients_data):
+    """
+    Читает агрегированные ингредиенты через серверный курсор,
+    не загружая всю выборку в память.
+    """
+    for ingredient in ingredients_data.iterator(chunk_size=CHUNK_SIZE):
+        yield (ingredient['ingredient__name'],
+               ingredient['total_amount'],
+               ingredient['ingredient__measurement_unit'])
+
+
+def _buffered(lines):
+    """Склеивает строки в блоки, чтобы не писать в сокет построчно."""
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _txt_lines(ingredients_data):
+    yield 'Список покупок:\n'
+    for name, total_amount, measurement_unit in _rows(ingredients_data):
+        yield f'{name} - {total_amount} {measurement_unit}\n'
+
+
+def _csv_lines(ingredients_data):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in _rows(ingredients_data):
+        yield writer.writerow(row)
+
+
+def _json_lines(ingredients_data):
+    yield '['
+    separator = ''
+    for name, total_amount, measurement_unit in _rows(ingredients_data):
+        yield separator + json.dumps(
+            {'name': name,
+             'amount': total_amount,
+             'measurement_unit': measurement_unit},
+            ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+# Формат -> (content type, генератор строк)
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', _txt_lines),
+    'csv': ('text/csv; charset=utf-8', _csv_lines),
+    'json': ('application/json', _json_lines),
+}
+DEFAULT_FORMAT = 'txt'
+
+
+def stream_shopping_list(ingredients_data, file_format):
+    """
+    Возвращает генератор блоков файла списка покупок в нужном формате.
+    """
+    _, lines = FORMATS[file_format]
+    return _buffered(lines(ingredients_data))
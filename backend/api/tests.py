@@ -0,0 +1,452 @@
+import base64
+import io
+import warnings
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from api.cache import LOCAL_CACHE_SIZE, _LocalCache
+from api.fields import Base64ImageField
+from foodgram.metrics import registry
+
+from recipes.cache import TAGS, reference_data
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+    Subscription, Tag, UserModel)
+from recipes.short_codes import encode_short_link
+
+RECIPES_COUNT = 100
+
+
+def create_user(number):
+    return UserModel.objects.create_user(
+        email=f'user{number}@example.com', username=f'user{number}',
+        first_name='Имя', last_name='Фамилия', password='password')
+
+
+class RecipeListQueriesTests(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+    # Выборка страницы, COUNT(*) пагинатора, теги, ингредиенты
+    ANONYMOUS_QUERIES = 4
+    # и подписки на авторов страницы
+    AUTHENTICATED_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        authors = [create_user(number) for number in range(1, 6)]
+        tags = [Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+                for number in range(3)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(10)]
+        for number in range(RECIPES_COUNT):
+            recipe = Recipe.objects.create(
+                author=authors[number % len(authors)],
+                name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/test.png', cooking_time=number + 1)
+            recipe.tags.set(tags[:number % len(tags) + 1])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in ingredients[number % 5:number % 5 + 3])
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscription.objects.create(user=cls.user, subscribed_to=authors[0])
+
+    def assert_list_queries(self, expected):
+        for limit in (1, RECIPES_COUNT):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(self.ANONYMOUS_QUERIES)
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(self.AUTHENTICATED_QUERIES)
+
+
+class CounterSignalsTests(APITestCase):
+    """Счётчики сходятся с данными при записи в обход API."""
+
+    def setUp(self):
+        self.user, self.author = create_user(0), create_user(1)
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=5)
+
+    def assert_counters(self, recipes, subscribers, favorites, in_cart):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, recipes)
+        self.assertEqual(self.author.subscribers_count, subscribers)
+        if favorites is not None:
+            self.recipe.refresh_from_db()
+            self.assertEqual(self.recipe.favorites_count, favorites)
+            self.assertEqual(self.recipe.in_cart_count, in_cart)
+
+    def test_relations(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        Subscription.objects.create(user=self.user, subscribed_to=self.author)
+        self.assert_counters(1, 1, 1, 1)
+
+        self.client.force_authenticate(self.user)
+        self.client.delete(f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assert_counters(1, 0, 0, 1)
+
+    def test_update_fields_skip_counters(self):
+        # В памяти остался счётчик до создания рецепта
+        self.author.first_name = 'Новое имя'
+        self.author.save(update_fields=['first_name', 'recipes_count'])
+        self.assert_counters(1, 0, 0, 0)
+        self.assertEqual(self.author.first_name, 'Новое имя')
+
+    def test_cascade_delete(self):
+        Subscription.objects.create(user=self.user, subscribed_to=self.author)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.recipe.delete()
+        self.assert_counters(0, 1, None, None)
+        self.user.delete()
+        self.assert_counters(0, 0, None, None)
+
+
+class StreamingMetricsTests(APITestCase):
+    """SQL-запросы при выдаче потокового ответа попадают в метрики."""
+
+    def test_shopping_cart_download(self):
+        user, author = create_user(0), create_user(1)
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=5)
+        IngredientInRecipe.objects.create(
+            recipe=recipe, amount=10, ingredient=Ingredient.objects.create(
+                name='Ингредиент', measurement_unit='г'))
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        self.client.force_authenticate(user)
+
+        key = ('recipes-download-shopping-cart', 'GET', '200')
+        before = dict(registry._counters.get(key, {}))
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(dict(registry._counters.get(key, {})), before)
+
+        body = b''.join(response.streaming_content)
+        self.assertIn('Ингредиент'.encode(), body)
+        counters = registry._counters[key]
+        self.assertEqual(counters['requests'],
+                         before.get('requests', 0) + 1)
+        self.assertEqual(counters['response_bytes'],
+                         before.get('response_bytes', 0) + len(body))
+        self.assertGreater(counters['db_queries'],
+                           before.get('db_queries', 0))
+
+
+class ServerTimingTests(APITestCase):
+
+    def test_header(self):
+        for enabled in (False, True):
+            with self.subTest(enabled=enabled):
+                with override_settings(SERVER_TIMING_ENABLED=enabled):
+                    response = self.client.get('/api/recipes/')
+                self.assertEqual('Server-Timing' in response, enabled)
+
+
+class Base64ImageFieldTests(APITestCase):
+
+    def setUp(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.encoded = base64.b64encode(buffer.getvalue()).decode()
+
+    def test_line_breaks(self):
+        wrapped = '\n'.join(self.encoded[start:start + 76]
+                            for start in range(0, len(self.encoded), 76))
+        image = Base64ImageField().to_internal_value(
+            f'data:image/png;base64,{wrapped}\r\n')
+        self.assertTrue(image.name.endswith('.png'))
+        image.close()
+
+    def test_invalid(self):
+        for data in ('data:image/png;base64,***', self.encoded[:40]):
+            with self.subTest(data=data[:30]):
+                with self.assertRaises(ValidationError):
+                    Base64ImageField().to_internal_value(data)
+
+
+class SubscriptionsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, author = create_user(0), create_user(1)
+        for number in range(3):
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/test.png', cooking_time=5)
+        Subscription.objects.create(user=cls.user, subscribed_to=author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def get_subscriptions(self, recipes_limit):
+        return self.client.get('/api/users/subscriptions/',
+                               {'recipes_limit': recipes_limit})
+
+    def test_recipes_limit(self):
+        for recipes_limit, count in (('0', 0), ('2', 2), ('10', 3)):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.get_subscriptions(recipes_limit)
+                self.assertEqual(response.status_code, 200)
+                [author] = response.data['results']
+                self.assertEqual(len(author['recipes']), count)
+                self.assertEqual(author['recipes_count'], 3)
+
+    def test_invalid_recipes_limit(self):
+        for recipes_limit in ('abc', '-1', '1.5'):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.get_subscriptions(recipes_limit)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recipes_limit', response.data)
+
+    def test_subscribe_invalid_recipes_limit(self):
+        author = create_user(2)
+        response = self.client.post(
+            f'/api/users/{author.pk}/subscribe/?recipes_limit=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscription.objects.filter(
+            user=self.user, subscribed_to=author).exists())
+
+
+class ReferenceDataCacheTests(APITestCase):
+    """Ответы справочников кэшируются и сбрасываются при изменении."""
+
+    def setUp(self):
+        cache.clear()
+        local_cache = mock.patch('api.cache._local_cache',
+                                 _LocalCache(LOCAL_CACHE_SIZE))
+        local_cache.start()
+        self.addCleanup(local_cache.stop)
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    @override_settings(CACHE_NAMESPACES={'reference_data': 0},
+                       REFERENCE_DATA_LOCAL_TTL=60)
+    def test_local_cache_without_shared(self):
+        first = self.client.get('/api/tags/')
+        self.assertEqual(len(first.json()), 1)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/tags/')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch')
+        changed = self.client.get('/api/tags/',
+                                  HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.json()), 2)
+
+    @override_settings(CACHE_NAMESPACES={'reference_data': 60},
+                       REFERENCE_DATA_LOCAL_TTL=0)
+    def test_shared_cache_key(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        # Пробелы и длина строки запроса не попадают в ключ кэша
+        params = {'name': 'Соль ' + 'x' * 300}
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', CacheKeyWarning)
+            first = self.client.get('/api/ingredients/', params)
+            with self.assertNumQueries(0):
+                second = self.client.get('/api/ingredients/', params)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.content, first.content)
+
+    @override_settings(CACHE_NAMESPACES={'reference_data': 60})
+    def test_invalidate(self):
+        version = reference_data.group_version(TAGS)
+        reference_data.set('key', 'value', group=TAGS, version=version)
+        self.assertEqual(reference_data.get('key', group=TAGS), 'value')
+        self.assertGreater(reference_data.invalidate(TAGS), version)
+        self.assertIsNone(reference_data.get('key', group=TAGS))
+
+
+@override_settings(CACHE_NAMESPACES={'recipes': 60})
+@mock.patch('recipes.images._executor', mock.Mock())
+class ShortLinksTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user(0)
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.author, name='Рецепт', text='Описание',
+                image='recipes/images/test.png', cooking_time=5)
+
+    def test_new_recipe_replaces_missing(self):
+        recipe = self.create_recipe()
+        self.assertRedirects(self.client.get(f'/r/{recipe.short_link}/'),
+                             f'/recipes/{recipe.pk}',
+                             fetch_redirect_response=False)
+        # Отсутствие следующего кода запомнено в кэше
+        short_link = encode_short_link(recipe.pk + 1)
+        self.assertEqual(
+            self.client.get(f'/r/{short_link}/').status_code, 404)
+
+        created = self.create_recipe()
+        self.assertEqual(created.short_link, short_link)
+        self.assertRedirects(self.client.get(f'/r/{short_link}/'),
+                             f'/recipes/{created.pk}',
+                             fetch_redirect_response=False)
+
+    def test_invalid_code(self):
+        for short_link in ('x' * 300, 'abc-def', 'ABCDEF12', 'abcdefgh'):
+            with self.subTest(short_link=short_link):
+                with self.assertNumQueries(0), mock.patch(
+                        'recipes.short_links.recipe_data') as cached:
+                    response = self.client.get(f'/r/{short_link}/')
+                self.assertEqual(response.status_code, 404)
+                self.assertFalse(cached.method_calls)
+
+
+class KeysetPaginationTests(APITestCase):
+    """Курсорная пагинация проходит ленту без пропусков и повторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(0)
+        users = [create_user(number) for number in range(1, 4)]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number % 4}',
+                text='Описание', image='recipes/images/test.png',
+                cooking_time=number % 3 + 1)
+            for number in range(10)]
+        for number, recipe in enumerate(cls.recipes):
+            for user in users[:number % 4]:
+                Favorite.objects.create(user=user, recipe=recipe)
+
+    def walk(self, params):
+        ids = []
+        url = '/api/recipes/'
+        params = {**params, 'pagination': 'cursor', 'limit': 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            # Ссылка на следующую страницу содержит все параметры
+            url, params = response.data['next'], {}
+        return ids
+
+    def test_orderings(self):
+        for ordering in (None, 'popular', 'newest', 'cooking_time'):
+            with self.subTest(ordering=ordering):
+                params = {} if ordering is None else {'ordering': ordering}
+                expected = [
+                    recipe['id'] for recipe in self.client.get(
+                        '/api/recipes/', {**params, 'limit': 100}
+                    ).data['results']]
+                self.assertEqual(len(expected), len(self.recipes))
+                self.assertEqual(self.walk(params), expected)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(
+            '/api/recipes/', {'ordering': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'cursor': 'bogus'}
+        ).status_code, 404)
+        # В остальных действиях ?ordering= не проверяется
+        self.assertEqual(self.client.get(
+            f'/api/recipes/{self.recipes[0].pk}/', {'ordering': 'bogus'}
+        ).status_code, 200)
+
+
+class TrendingTests(APITestCase):
+    """Популярное считается по добавлениям за последние дни."""
+
+    def test_trending(self):
+        author = create_user(0)
+        users = [create_user(number) for number in range(1, 4)]
+        recent, single, stale = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                image='recipes/images/test.png', cooking_time=5)
+            for number in range(3)]
+        for user in users[:2]:
+            Favorite.objects.create(user=user, recipe=recent)
+        Favorite.objects.create(user=users[0], recipe=single)
+        old = [Favorite.objects.create(user=user, recipe=stale).pk
+               for user in users]
+        old.append(ShoppingCart.objects.create(
+            user=users[2], recipe=single).pk)
+        month_ago = timezone.now() - timedelta(days=30)
+        Favorite.objects.filter(pk__in=old[:-1]).update(created=month_ago)
+        ShoppingCart.objects.filter(pk=old[-1]).update(created=month_ago)
+
+        call_command('compute_trending', stdout=io.StringIO())
+        response = self.client.get('/api/recipes/trending/',
+                                   {'fields': 'id,name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recent.pk, single.pk])
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+
+class SparseFieldsTests(APITestCase):
+    """?fields= и ?omit= ограничивают ответ и загружаемые данные."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(0)
+        cls.recipe = Recipe.objects.create(
+            author=create_user(1), name='Рецепт', text='Описание',
+            image='recipes/images/test.png', cooking_time=5)
+        cls.recipe.tags.set([Tag.objects.create(name='Тег', slug='tag')])
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def test_list_fields(self):
+        # Без тегов и ингредиентов: только выборка страницы и COUNT(*)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/recipes/', {'fields': 'id,name'})
+        self.assertEqual(response.data['results'],
+                         [{'id': self.recipe.pk, 'name': 'Рецепт'}])
+
+    def test_omit(self):
+        response = self.client.get('/api/recipes/',
+                                   {'omit': 'text,ingredients'})
+        [recipe] = response.data['results']
+        self.assertNotIn('text', recipe)
+        self.assertNotIn('ingredients', recipe)
+        self.assertEqual(recipe['tags'][0]['slug'], 'tag')
+
+    def test_retrieve_user_flags(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/',
+                                   {'fields': 'id,is_favorited'})
+        self.assertEqual(response.data,
+                         {'id': self.recipe.pk, 'is_favorited': True})
+
+    def test_unknown_field(self):
+        for url in ('/api/recipes/', '/api/users/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'fields': 'id,password'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('fields', response.data)
@@ -1,38 +1,79 @@
-import os
-
 from djoser.conf import settings
 from djoser.views import UserViewSet
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
 from rest_framework.permissions import (
     AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 )
 from rest_framework.response import Response
 
-from api.paginators import Pagination
+from api.cache import (
+    ReferenceDataCacheMixin, get_author_profile, get_recipe_representation)
+from api.paginators import Pagination, select_pagination
+from api.projection import SparseFieldsViewMixin, model_columns
+from api.shopping_cart import DEFAULT_FORMAT, FORMATS, stream_shopping_list
 from api.serializers import (
-    AvatarUpdateSerializer, RecipeShortSerializer,
+    AvatarUpdateSerializer, RecipeReadSerializer, RecipeShortSerializer,
     SubscribedUsersSerializer, TagSerializer,
-    IngredientSerializer, RecipeSerializer, UserModelSerializer
+    IngredientSerializer, RecipeSerializer, UserModelSerializer,
+    get_recipes_limit
 )
 from api.filters import IngredientFilter, RecipeFilter
 from api.permissions import AuthorOrReadOnly
+from recipes.cache import INGREDIENTS, TAGS, recipe_data
+from recipes.constants import INGREDIENT_SEARCH_LIMIT
 from recipes.models import (
     Favorite, Ingredient, IngredientInRecipe, ShoppingCart,
     Subscription, Tag, Recipe, UserModel
 )
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(SparseFieldsViewMixin, UserViewSet):
     serializer_class = UserModelSerializer
     queryset = UserModel.objects.all()
     permission_classes = [AllowAny]
     pagination_class = Pagination
+    # Порядок для курсорной пагинации (?pagination=cursor)
+    keyset_ordering = ('username', 'id')
+    sparse_fields_actions = ('list', 'retrieve', 'subscriptions')
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = select_pagination(self.request,
+                                                self.keyset_ordering)
+        return self._paginator
+
+    def get_serializer_class(self):
+        if self.action == 'subscriptions':
+            return SubscribedUsersSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """
+        Для списка, профиля и подписок загружаются только столбцы, нужные
+        сериализатору (без пароля и служебных полей), а подписка
+        текущего пользователя вычисляется подзапросом EXISTS.
+        Поддерживается ?fields= для выбора полей ответа.
+        """
+        queryset = super().get_queryset()
+        if self.action not in self.sparse_fields_actions:
+            return queryset
+        queryset = queryset.only(
+            *self.get_projected_columns(),
+            *(field.lstrip('-') for field in self.keyset_ordering))
+        user = self.request.user
+        if user.is_authenticated and self.wants_field('is_subscribed'):
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, subscribed_to=OuterRef('pk'))))
+        return queryset
 
     def get_permissions(self):
         if self.action == 'me':
@@ -70,14 +111,11 @@ class UsersViewSet(UserViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
 
-        # Обработка удаления аватара
-        # Удаление аватара
-        avatar_exists = user.avatar and os.path.isfile(user.avatar.path)
-
-        if avatar_exists:
-            avatar_path = user.avatar.path  # Получаем путь к файлу
-            os.remove(avatar_path)  # Удаляем файл
-            user.avatar.delete()  # Удаляем аватар из модели
+        # Удаление аватара: файлы освобождаются в фоне
+        # (recipes/signals.py)
+        if user.avatar:
+            user.avatar = None
+            user.save()
             return Response({"detail": "Аватар успешно удален."},
                             status=status.HTTP_204_NO_CONTENT)
 
@@ -92,16 +130,26 @@ class UsersViewSet(UserViewSet):
         """
         Получение списка подписок текущего пользователя с пагинацией.
         """
-        user = request.user
-        subscriptions = Subscription.objects.filter(user=user)
-        subscribed_users = UserModel.objects.filter(
-            pk__in=subscriptions.values_list('subscribed_to', flat=True)
-        )
-        paginator = Pagination()
+        subscriptions = Subscription.objects.filter(user=request.user)
+        subscribed_users = self.get_queryset().filter(
+            pk__in=subscriptions.values_list('subscribed_to', flat=True))
+        if self.wants_field('recipes'):
+            # Превью рецептов загружаются одним запросом на всю страницу:
+            # срез в Prefetch выполняется оконной функцией по каждому
+            # автору.
+            recipes_limit = get_recipes_limit(request)
+            recipes = Recipe.objects.only(
+                'id', 'name', 'image', 'image_variants', 'cooking_time',
+                'author_id')
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+            subscribed_users = subscribed_users.prefetch_related(
+                Prefetch('recipes', queryset=recipes,
+                         to_attr='recipe_previews'))
+        paginator = select_pagination(request, self.keyset_ordering)
         paginated_users = paginator.paginate_queryset(subscribed_users,
                                                       request)
-        serializer = SubscribedUsersSerializer(paginated_users, many=True,
-                                               context={'request': request})
+        serializer = self.get_serializer(paginated_users, many=True)
         return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['POST', 'DELETE'],
@@ -117,6 +165,9 @@ class UsersViewSet(UserViewSet):
                     {'error': 'Вы не можете подписаться на самого себя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            # recipes_limit проверяется до создания подписки,
+            # а не при выдаче ответа
+            get_recipes_limit(request)
 
             _, created = Subscription.objects.get_or_create(
                 user=user,
@@ -135,12 +186,11 @@ class UsersViewSet(UserViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        subscription = Subscription.objects.filter(
+        deleted_count, _ = Subscription.objects.filter(
             user=user, subscribed_to=user_to_subscribe
-        )
+        ).delete()
 
-        if subscription.exists():
-            subscription.delete()
+        if deleted_count:
             return Response(
                 {"detail": "Successfully unsubscribed."},
                 status=status.HTTP_204_NO_CONTENT
@@ -152,7 +202,8 @@ class UsersViewSet(UserViewSet):
         )
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceDataCacheMixin, viewsets.ReadOnlyModelViewSet):
+    cache_group = TAGS
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
@@ -160,8 +211,10 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     http_method_names = ('get',)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceDataCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с ингредиентами."""
+    cache_group = INGREDIENTS
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
@@ -170,9 +223,26 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
-
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    def filter_queryset(self, queryset):
+        """
+        Ограничивает выдачу автодополнения по названию, чтобы ответ
+        не рос вместе со справочником ингредиентов.
+        """
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('name'):
+            return queryset[:INGREDIENT_SEARCH_LIMIT]
+        return queryset
+
+
+class RecipeViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
+    # Автор, теги и ингредиенты загружаются пакетно: страница из N рецептов
+    # обходится постоянным числом запросов.
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.all()),
+        Prefetch('ingredients_in_recipe',
+                 queryset=IngredientInRecipe.objects.select_related(
+                     'ingredient')),
+    )
     serializer_class = RecipeSerializer
     pagination_class = Pagination  # Настроенная пагинация
     http_method_names = ('get', 'post', 'patch', 'delete')
@@ -180,6 +250,173 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_class = RecipeFilter
     filterset_fields = ['author']  # Фильтрация по автору
+    # Сортировки ленты (?ordering=...). Последнее поле - уникальный
+    # ключ, чтобы порядок был стабильным для курсорной пагинации.
+    # Каждой сортировке соответствует составной индекс Recipe.
+    default_ordering = ('name', 'id')
+    orderings = {
+        'popular': ('-favorites_count', 'id'),
+        'newest': ('-pub_date', '-id'),
+        'cooking_time': ('cooking_time', 'id'),
+    }
+    trending_ordering = ('-trending_score', 'id')
+    sparse_fields_actions = ('list', 'retrieve', 'trending')
+    # Флаги текущего пользователя и модели, по которым они вычисляются
+    user_flags = {
+        'is_favorited': Favorite,
+        'is_in_shopping_cart': ShoppingCart,
+    }
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = select_pagination(self.request,
+                                                self.keyset_ordering)
+        return self._paginator
+
+    @property
+    def keyset_ordering(self):
+        """Текущий порядок ленты, он же порядок курсорной пагинации."""
+        if self.action == 'trending':
+            return self.trending_ordering
+        ordering = self.request.query_params.get('ordering')
+        # ?ordering= относится только к ленте: в остальных действиях
+        # параметр игнорируется, а не даёт ошибку 400
+        if self.action != 'list' or ordering is None:
+            return self.default_ordering
+        if ordering not in self.orderings:
+            raise ValidationError({
+                'ordering': 'Доступные значения: '
+                            f'{", ".join(self.orderings)}.'})
+        return self.orderings[ordering]
+
+    def get_serializer_class(self):
+        # RecipeSerializer отдаёт то же представление через
+        # RecipeReadSerializer, для чтения используем его напрямую,
+        # чтобы работал выбор полей
+        if self.action in self.sparse_fields_actions:
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """
+        Аннотирует рецепты флагами is_favorited и is_in_shopping_cart
+        для текущего пользователя одним запросом вместо запроса на рецепт.
+        При чтении загружаются только столбцы, связи и флаги,
+        нужные полям ответа (?fields=, ?omit=).
+        """
+        if self.action in self.sparse_fields_actions:
+            queryset = self._project(Recipe.objects.all())
+        else:
+            queryset = super().get_queryset()
+        if self.action == 'trending':
+            queryset = queryset.filter(trending__isnull=False).annotate(
+                trending_score=F('trending__score'))
+        if self.action in ('list', 'trending'):
+            queryset = queryset.order_by(*self.keyset_ordering)
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return self._annotate_user_flags(
+            queryset, user,
+            [flag for flag in self.user_flags if self.wants_field(flag)])
+
+    def _project(self, queryset):
+        """Ограничивает выборку полями, выбранными для ответа."""
+        columns = self.get_projected_columns()
+        if self.action in ('list', 'trending'):
+            # Поля сортировки нужны курсорной пагинации
+            columns.update(field.lstrip('-')
+                           for field in self.keyset_ordering
+                           if field != '-trending_score')
+        if self.wants_field('author'):
+            queryset = queryset.select_related('author')
+            columns.update(f'author__{column}' for column in model_columns(
+                UserModelSerializer()))
+        if self.wants_field('tags'):
+            queryset = queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.all()))
+        if self.wants_field('ingredients'):
+            queryset = queryset.prefetch_related(
+                Prefetch('ingredients_in_recipe',
+                         queryset=IngredientInRecipe.objects.select_related(
+                             'ingredient')))
+        return queryset.only(*columns)
+
+    @classmethod
+    def _annotate_user_flags(cls, queryset, user, flags=None):
+        return queryset.annotate(**{
+            flag: Exists(cls.user_flags[flag].objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            for flag in (cls.user_flags if flags is None else flags)
+        })
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Детальное представление рецепта. Общая для всех часть берётся
+        из кэша, флаги текущего пользователя (is_favorited,
+        is_in_shopping_cart, author.is_subscribed) добавляются
+        отдельным запросом.
+        """
+        if not recipe_data.enabled:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+
+        data = get_recipe_representation(self.queryset, pk)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            data = {name: value for name, value in data.items()
+                    if name in fields}
+
+        # Флаги вычисляются только для выбранных полей
+        flags = [flag for flag in self.user_flags if flag in data]
+        if 'author' in data:
+            data['author'] = get_author_profile(data['author'])
+            flags.append('is_subscribed')
+        values = dict.fromkeys(flags, False)
+        user = request.user
+        if user.is_authenticated and flags:
+            values = get_object_or_404(
+                self._annotate_user_flags(
+                    Recipe.objects.filter(pk=pk), user,
+                    [flag for flag in flags if flag in self.user_flags]
+                ).annotate(
+                    is_subscribed=Exists(Subscription.objects.filter(
+                        user=user, subscribed_to=OuterRef('author')))
+                ).values(*flags)
+            )
+        for flag in self.user_flags:
+            if flag in data:
+                data[flag] = values[flag]
+        if 'author' in data:
+            data['author']['is_subscribed'] = values['is_subscribed']
+
+        # В кэше ссылки относительные, хост берём из текущего запроса
+        if 'image' in data:
+            data['image'] = request.build_absolute_uri(data['image'])
+        if 'image_variants' in data:
+            data['image_variants'] = _absolute_variants(
+                request, data['image_variants'])
+        if 'author' in data:
+            author = data['author']
+            if author['avatar']:
+                author['avatar'] = request.build_absolute_uri(
+                    author['avatar'])
+            author['avatar_variants'] = _absolute_variants(
+                request, author['avatar_variants'])
+        return Response(data)
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def trending(self, request):
+        """
+        Популярные в последнее время рецепты по предрассчитанному
+        рейтингу (команда compute_trending). Фильтры ленты
+        применяются так же, как в списке.
+        """
+        return self.list(request)
 
     @action(detail=True, methods=['get'], permission_classes=[AllowAny],
             url_path='get-link')
@@ -200,21 +437,39 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response({"short-link": short_url}, status=status.HTTP_200_OK)
 
+    def perform_content_negotiation(self, request, force=False):
+        """
+        Для выгрузки списка покупок параметр ?format= выбирает формат
+        файла, а не рендерер DRF, поэтому неизвестный рендереру формат
+        не должен приводить к 404.
+        """
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     @action(detail=False, methods=['get'], url_path='download_shopping_cart',
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
         """
         Формирует и возвращает файл со списком покупок.
+        Формат задаётся параметром ?format=txt|csv|json (по умолчанию txt).
         """
+        file_format = request.query_params.get('format', DEFAULT_FORMAT)
+        if file_format not in FORMATS:
+            return Response(
+                {'error': 'Неподдерживаемый формат. Доступные форматы: '
+                          f'{", ".join(FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+
         user = request.user
         # Получаем список ингредиентов, находящихся в корзине пользователя
         ingredients_data = self.get_ingredients_for_shopping_cart(user)
-        if not ingredients_data:
+        if not ingredients_data.exists():
             return Response({'error': 'Корзина пуста.'},
                             status=status.HTTP_400_BAD_REQUEST)
 
         # Формируем и возвращаем файл с данными
-        return self.generate_shopping_cart_file(ingredients_data)
+        return self.generate_shopping_cart_file(ingredients_data, file_format)
 
     def get_ingredients_for_shopping_cart(self, user):
         """
@@ -235,22 +490,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ).order_by('ingredient__name')
         return ingredients_data
 
-    def generate_shopping_cart_file(self, ingredients_data):
+    def generate_shopping_cart_file(self, ingredients_data,
+                                    file_format=DEFAULT_FORMAT):
         """
         Генерирует файл с покупками на основе полученных ингредиентов.
+        Строки отдаются потоком, без сборки всего файла в памяти.
         """
-        shopping_list = "Список покупок:\n"
-
-        for ingredient in ingredients_data:
-            name = ingredient['ingredient__name']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            total_amount = ingredient['total_amount']
-            shopping_list += f"{name} - {total_amount} {measurement_unit}\n"
-
-        # Создаем ответ с файлом
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response[
-            'Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
+        content_type, _ = FORMATS[file_format]
+        response = StreamingHttpResponse(
+            stream_shopping_list(ingredients_data, file_format),
+            content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"')
 
         return response
 
@@ -338,3 +589,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response({'error': 'Рецепт не найден.'},
                         status=status.HTTP_400_BAD_REQUEST)
+
+
+def _absolute_variants(request, variants):
+    """Абсолютные ссылки на варианты изображения из кэша."""
+    return {
+        variant: {image_format: request.build_absolute_uri(url)
+                  for image_format, url in files.items()}
+        for variant, files in variants.items()
+    }
@@ -0,0 +1,139 @@
+"""
+Небольшая обёртка над кэшем Django: пространства имён, TTL
+и группы инвалидации.
+
+Каждое приложение работает со своим пространством имён, TTL которого
+задаётся в settings.CACHE_NAMESPACES. Если пространство не указано
+в настройках или его TTL равен 0, кэш для него выключен: get()
+всегда возвращает default, а set() ничего не делает.
+
+Группа объединяет ключи, которые сбрасываются вместе. У группы есть
+версия (счётчик инвалидаций), она входит в итоговый ключ,
+поэтому invalidate() не удаляет записи, а делает их недоступными,
+и они вытесняются бэкендом по TTL.
+
+Значение, построенное по данным из БД, записывается под версией,
+прочитанной до обращения к БД: group_version() передаётся в get()
+и set() аргументом version. Иначе изменение, зафиксированное между
+чтением из БД и записью, оставило бы в кэше устаревшие данные
+под новой версией.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+GROUP_VERSION_KEY = '{namespace}:group:{group}:version'
+KEY_PREFIX = '{namespace}:{group}:{version}:'
+
+
+class NamespacedCache:
+    """Кэш одного пространства имён (приложения)."""
+
+    def __init__(self, namespace, alias='default'):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def timeout(self):
+        """TTL пространства имён в секундах, 0 - кэш выключен."""
+        return settings.CACHE_NAMESPACES.get(self.namespace, 0)
+
+    @property
+    def enabled(self):
+        return self.timeout > 0
+
+    def group_version(self, group):
+        """
+        Возвращает версию группы, создавая её при первом обращении.
+        """
+        key = self._group_version_key(group)
+        version = self.backend.get(key)
+        if version is None:
+            self.backend.add(key, _initial_version(), None)
+            version = self.backend.get(key)
+        return version
+
+    def invalidate(self, group):
+        """Сбрасывает все ключи группы, возвращает новую версию."""
+        key = self._group_version_key(group)
+        # incr атомарен в memcached и redis: две инвалидации подряд
+        # всегда дают разные версии
+        try:
+            return self.backend.incr(key)
+        except ValueError:
+            # Версии ещё нет или её вытеснили
+            if self.backend.add(key, _initial_version(), None):
+                return self.backend.get(key)
+            return self.backend.incr(key)
+
+    def make_key(self, key, group='', version=None):
+        return self._key_prefix(group, version) + str(key)
+
+    def get(self, key, default=None, group='', version=None):
+        if not self.enabled:
+            return default
+        return self.backend.get(self.make_key(key, group, version), default)
+
+    def get_many(self, keys, group='', version=None):
+        """Возвращает словарь {key: value} для найденных ключей."""
+        if not self.enabled or not keys:
+            return {}
+        prefix = self._key_prefix(group, version)
+        full_keys = {prefix + str(key): key for key in keys}
+        found = self.backend.get_many(full_keys)
+        return {full_keys[full_key]: value
+                for full_key, value in found.items()}
+
+    def set(self, key, value, timeout=None, group='', version=None):
+        if not self.enabled:
+            return
+        self.backend.set(self.make_key(key, group, version), value,
+                         timeout or self.timeout)
+
+    def set_many(self, data, timeout=None, group='', version=None):
+        if not self.enabled or not data:
+            return
+        prefix = self._key_prefix(group, version)
+        self.backend.set_many(
+            {prefix + str(key): value for key, value in data.items()},
+            timeout or self.timeout)
+
+    def delete(self, key, group=''):
+        self.backend.delete(self.make_key(key, group))
+
+    def get_or_set(self, key, default, timeout=None, group=''):
+        """
+        Возвращает значение из кэша или вычисляет его вызовом
+        default() и сохраняет.
+        """
+        version = self.group_version(group) if group else 0
+        value = self.get(key, group=group, version=version)
+        if value is None:
+            value = default()
+            self.set(key, value, timeout, group, version)
+        return value
+
+    def _key_prefix(self, group, version=None):
+        """Префикс ключей группы с версией version или текущей."""
+        if version is None:
+            version = self.group_version(group) if group else 0
+        return KEY_PREFIX.format(namespace=self.namespace, group=group,
+                                 version=version)
+
+    def _group_version_key(self, group):
+        return GROUP_VERSION_KEY.format(namespace=self.namespace,
+                                        group=group)
+
+
+def _initial_version():
+    """
+    Начальная версия группы - время в микросекундах: если версию
+    вытеснили из кэша, новая больше любой прежней и не совпадёт
+    с версиями оставшихся записей.
+    """
+    return time.time_ns() // 1000
@@ -0,0 +1,242 @@
+"""
+Метрики запросов: число SQL-запросов, время в БД, время рендеринга
+и размер ответа по каждому view/action.
+
+QueryMetricsMiddleware собирает показатели запроса, добавляет их
+в заголовок Server-Timing (settings.SERVER_TIMING_ENABLED, по умолчанию
+только при DEBUG) и накапливает в реестре процесса, который отдаётся
+в формате Prometheus по адресу /metrics.
+Адрес не проксируется nginx и доступен только из сети контейнеров
+(см. README). Запросы потоковых ответов (выгрузка списка покупок)
+учитываются вместе с генерацией тела.
+Реестр свой у каждого процесса gunicorn.
+
+Если запрос выполнил больше settings.QUERY_COUNT_WARNING запросов,
+в лог пишется предупреждение с повторяющимися запросами (N+1).
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограммы длительности запросов, секунды
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Сколько повторяющихся запросов показывать в предупреждении
+DUPLICATES_IN_WARNING = 5
+UNRESOLVED_VIEW = 'unresolved'
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    """
+    Отпечаток запроса: параметры и так вынесены в %s, остаётся
+    свернуть списки IN разной длины.
+    """
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class RequestMetrics:
+    """Обёртка выполнения SQL, собирающая показатели одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return [(sql, count) for sql, count
+                in self.fingerprints.most_common(DUPLICATES_IN_WARNING)
+                if count > 1]
+
+
+class MetricsRegistry:
+    """Накопленные метрики процесса по (view, метод, статус)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+
+    def observe(self, view, method, status, duration, render_time,
+                metrics, size):
+        key = (view, method, str(status))
+        with self._lock:
+            counters = self._counters[key]
+            counters['requests'] += 1
+            counters['duration'] += duration
+            counters['db_queries'] += metrics.queries
+            counters['db_time'] += metrics.sql_time
+            counters['render_time'] += render_time
+            counters['response_bytes'] += size
+            buckets = self._buckets[key]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus."""
+        with self._lock:
+            counters = {key: dict(value)
+                        for key, value in self._counters.items()}
+            buckets = {key: list(value)
+                       for key, value in self._buckets.items()}
+        lines = []
+        for name, field, help_text in (
+                ('http_requests_total', 'requests',
+                 'Количество запросов'),
+                ('http_db_queries_total', 'db_queries',
+                 'Количество SQL-запросов'),
+                ('http_db_seconds_total', 'db_time',
+                 'Время выполнения SQL-запросов'),
+                ('http_render_seconds_total', 'render_time',
+                 'Время рендеринга ответа'),
+                ('http_response_bytes_total', 'response_bytes',
+                 'Размер ответов')):
+            lines.append(f'# HELP foodgram_{name} {help_text}')
+            lines.append(f'# TYPE foodgram_{name} counter')
+            for key, values in sorted(counters.items()):
+                lines.append(
+                    f'foodgram_{name}{{{_labels(key)}}} {values[field]:g}')
+
+        name = 'foodgram_http_request_duration_seconds'
+        lines.append(f'# HELP {name} Длительность запросов')
+        lines.append(f'# TYPE {name} histogram')
+        for key, values in sorted(counters.items()):
+            labels = _labels(key)
+            for bound, count in zip(DURATION_BUCKETS, buckets[key]):
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} '
+                         f'{values["requests"]:g}')
+            lines.append(f'{name}_sum{{{labels}}} {values["duration"]:g}')
+            lines.append(f'{name}_count{{{labels}}} {values["requests"]:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(key):
+    view, method, status = key
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+registry = MetricsRegistry()
+
+
+class QueryMetricsMiddleware:
+    """
+    Измеряет каждый запрос. Подключается первым в MIDDLEWARE,
+    чтобы учитывать запросы к БД из остальных middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request._render_time = 0.0
+        started = time.perf_counter()
+        with _collect(metrics):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match else UNRESOLVED_VIEW
+        if settings.SERVER_TIMING_ENABLED:
+            # Заголовки потокового ответа уходят до тела: в них
+            # попадает только работа до начала выдачи
+            response['Server-Timing'] = _server_timing(
+                time.perf_counter() - started, request._render_time,
+                metrics)
+        if response.streaming:
+            response.streaming_content = self._stream(
+                response.streaming_content, request, view,
+                response.status_code, started, metrics)
+        else:
+            self._record(request, view, response.status_code, started,
+                         metrics, len(response.content))
+        return response
+
+    def _stream(self, content, request, view, status, started, metrics):
+        """
+        Отдаёт тело потокового ответа, учитывая SQL-запросы, которые
+        выполняются при его генерации. Запрос записывается в метрики
+        после отправки последней части.
+        """
+        size = 0
+        try:
+            with _collect(metrics):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._record(request, view, status, started, metrics, size)
+
+    def _record(self, request, view, status, started, metrics, size):
+        duration = time.perf_counter() - started
+        if settings.METRICS_ENABLED:
+            registry.observe(view, request.method, status, duration,
+                             request._render_time, metrics, size)
+        if metrics.queries > settings.QUERY_COUNT_WARNING:
+            logger.warning(
+                '%s %s (%s): %d SQL-запросов за %.1f мс. Повторы:\n%s',
+                request.method, request.path, view, metrics.queries,
+                metrics.sql_time * 1000,
+                '\n'.join(f'{count} x {sql}'
+                          for sql, count in metrics.duplicates()) or 'нет')
+
+    def process_template_response(self, request, response):
+        """
+        Ответы DRF рендерятся после выхода из view: засекаем время
+        рендеринга через post-render callback.
+        """
+        started = time.perf_counter()
+
+        def finish(rendered):
+            request._render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(finish)
+        return response
+
+
+@contextmanager
+def _collect(metrics):
+    """Подключает metrics к выполнению SQL на всех соединениях."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        yield
+
+
+def _server_timing(duration, render_time, metrics):
+    app_time = max(duration - metrics.sql_time - render_time, 0)
+    return ', '.join((
+        f'db;dur={metrics.sql_time * 1000:.1f};'
+        f'desc="{metrics.queries} queries"',
+        f'render;dur={render_time * 1000:.1f}',
+        f'app;dur={app_time * 1000:.1f}',
+        f'total;dur={duration * 1000:.1f}',
+    ))
+
+
+def metrics_view(request):
+    """Метрики процесса в формате Prometheus."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -7,6 +7,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.environ.get('SECRET_KEY', get_random_secret_key())
 
+# Ключ перестановки кодов коротких ссылок (recipes/short_codes.py).
+# Должен быть постоянным: при смене ключа новые коды могут совпасть
+# с уже выданными.
+SHORT_LINK_SECRET = os.environ.get('SHORT_LINK_SECRET', 'foodgram-short-links')
+
 DEBUG = os.environ.get('DEBUG', 'True') == 'True'
 
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '127.0.0.1').split(',')
@@ -28,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы учитывать SQL-запросы остальных middleware
+    'foodgram.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -70,6 +77,70 @@ DATABASES = {
     }
 }
 
+# Кэш. Бэкенд выбирается переменной CACHE_BACKEND:
+# locmem - для разработки (у каждого воркера gunicorn свой кэш),
+# file - общий кэш для нескольких воркеров на одной машине,
+# memcached / redis - общий кэш для нескольких контейнеров.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+# Инвалидация в locmem не доходит до других воркеров, поэтому
+# с ним пространства имён по умолчанию выключены
+CACHE_SHARED = CACHE_BACKEND != 'locmem'
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', BASE_DIR / 'cache/'),
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+    },
+}
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        'KEY_PREFIX': 'foodgram',
+    },
+}
+
+# Пространства имён кэша (см. foodgram/cache.py) и их TTL в секундах.
+# 0 выключает кэш для пространства.
+CACHE_NAMESPACES = {
+    'reference_data': int(os.getenv('CACHE_REFERENCE_DATA_TTL',
+                                    60 * 60 * 24 if CACHE_SHARED else 0)),
+    'recipes': int(os.getenv('CACHE_RECIPES_TTL',
+                             60 * 60 if CACHE_SHARED else 0)),
+    'users': int(os.getenv('CACHE_USERS_TTL',
+                           60 * 10 if CACHE_SHARED else 0)),
+}
+# TTL ответов справочников в памяти процесса (см. api/cache.py),
+# 0 выключает этот уровень. Работает и без общего кэша: инвалидация
+# из другого воркера доходит до процесса не позже, чем через TTL.
+REFERENCE_DATA_LOCAL_TTL = int(os.getenv('REFERENCE_DATA_LOCAL_TTL', 60))
+
+# Метрики запросов (см. foodgram/metrics.py): накопление для /metrics,
+# заголовок Server-Timing и порог числа SQL-запросов, после которого
+# в лог пишется предупреждение с повторяющимися запросами.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Server-Timing раскрывает клиентам внутренние тайминги, поэтому
+# по умолчанию он включён только в режиме отладки
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED',
+                                  str(DEBUG)) == 'True'
+QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', 30))
+
+# Потоки фоновой обработки изображений (см. recipes/images.py)
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+# Ограничения загружаемых картинок в base64 (см. api/fields.py)
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv('IMAGE_UPLOAD_MAX_BYTES',
+                                       10 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS',
+                                        40_000_000))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -137,6 +208,16 @@ STATIC_ROOT = BASE_DIR / 'static/'
 MEDIA_URL = '/media/'  # URL, по которому будут доступны медиафайлы
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# Медиафайлы именуются по хэшу содержимого (foodgram/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'foodgram.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 PAGE_SIZE = 10
@@ -0,0 +1,145 @@
+"""
+Хранилище медиафайлов с адресацией по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого:
+recipes/images/ab/ab12...ef.png. Одинаковые файлы хранятся один раз,
+а содержимое файла под конкретным именем никогда не меняется, поэтому
+nginx отдаёт такие файлы с Cache-Control: immutable.
+
+Сколько раз файл был сохранён, учитывается в таблице StoredFile
+в той же транзакции, что и сохранение объекта. delete() уменьшает
+счётчик и удаляет файл, только когда ссылок не осталось. Файлы,
+сохранённые до перехода на это хранилище, счётчика не имеют
+и удаляются сразу, как в FileSystemStorage.
+
+Удаление и повторное сохранение того же содержимого согласуются
+блокировкой строки счётчика: _save() берёт ссылку до того, как
+положить файл, а удаление после фиксации транзакции заново проверяет
+счётчик под блокировкой и не трогает файл, на который появилась
+новая ссылка.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+HASH_DIR_LENGTH = 2
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save()
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        # Хэш считается при записи во временный файл, за один проход
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=full_directory,
+                                             suffix='.upload')
+        retained = False
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            content_hash = digest.hexdigest()
+            name = posixpath.join(directory, content_hash[:HASH_DIR_LENGTH],
+                                  content_hash + extension)
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Ссылка берётся до того, как положить файл: удаление
+            # того же файла, которое уже идёт, дождётся её и файл
+            # не тронет, а завершённое - освободит путь для записи
+            self.retain(name)
+            retained = True
+            if os.path.exists(path):
+                os.remove(temp_path)
+                # Свежее время изменения защищает файл от удаления
+                # командой collect_media, пока ссылка не зафиксирована
+                os.utime(path)
+            else:
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                # Параллельная запись того же содержимого безопасна:
+                # os.replace атомарен, а содержимое одинаковое
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if retained:
+                self.delete(name)
+            raise
+        return name
+
+    def retain(self, name, count=1):
+        """Добавляет count ссылок на уже сохранённый файл."""
+        stored_file = self._stored_files()
+        with transaction.atomic():
+            # UPDATE ждёт, пока _remove() не закончит удаление файла
+            if stored_file.objects.filter(name=name).update(
+                    references=F('references') + count):
+                return
+            try:
+                with transaction.atomic():
+                    stored_file.objects.create(name=name, references=count)
+            except IntegrityError:
+                # Строку создало параллельное сохранение того же файла
+                stored_file.objects.filter(name=name).update(
+                    references=F('references') + count)
+
+    def delete(self, name):
+        """
+        Убирает ссылку на файл. Сам файл удаляется после фиксации
+        транзакции, если ссылок больше нет.
+        """
+        if not name:
+            raise ValueError('Имя файла не может быть пустым.')
+        stored_file = self._stored_files()
+        with transaction.atomic():
+            counter = stored_file.objects.select_for_update().filter(
+                name=name).first()
+            if counter is not None and counter.references > 1:
+                stored_file.objects.filter(name=name).update(
+                    references=F('references') - 1)
+                return
+            if counter is not None:
+                # Строка остаётся до удаления файла: её блокировка
+                # согласует удаление с повторным сохранением
+                stored_file.objects.filter(name=name).update(references=0)
+        transaction.on_commit(lambda: self._remove(name))
+
+    def _remove(self, name):
+        """Удаляет файл, если на него так и не появилось новых ссылок."""
+        stored_file = self._stored_files()
+        with transaction.atomic():
+            counter = stored_file.objects.select_for_update().filter(
+                name=name).first()
+            if counter is not None and counter.references > 0:
+                return
+            super().delete(name)
+            if counter is not None:
+                counter.delete()
+
+    def references(self, name):
+        """Число ссылок на файл, None - файл без учёта ссылок."""
+        return self._stored_files().objects.filter(name=name).values_list(
+            'references', flat=True).first()
+
+    @staticmethod
+    def _stored_files():
+        # Модель загружается лениво: хранилище используется
+        # в определении полей моделей того же приложения
+        return apps.get_model('recipes', 'StoredFile')
@@ -1,16 +1,15 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
-from django.db.models import Count
 
 from recipes.models import (
-    IngredientInRecipe, UserModel, Recipe, Tag, Ingredient)
+    IngredientInRecipe, UserModel, Recipe, Tag, Ingredient, TrendingRecipe)
 
 
 @admin.register(UserModel)
 class UserModelAdmin(UserAdmin):
     list_display = ('username', 'id', 'email', 'first_name', 'last_name',
-                    'is_staff')
+                    'is_staff', 'recipes_count', 'subscribers_count')
     list_filter = ('is_staff', 'is_superuser')
     search_fields = ('username', 'email')
     ordering = ('username',)
@@ -37,26 +36,13 @@ class IngredientInRecipeInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'id', 'author', 'favorites_count')
+    list_display = ('name', 'id', 'author', 'favorites_count',
+                    'in_cart_count')
+    list_select_related = ('author',)
     inlines = [IngredientInRecipeInline]
     filter_horizontal = ('tags',)
     list_filter = ('name',)
 
-    def get_queryset(self, request):
-        """
-        Переопределение метода для добавления поля favorites_count
-        в выборку данных.
-        """
-        queryset = super().get_queryset(request)
-        return queryset.annotate(favorites_count=Count('favorites'))
-
-    @admin.display(description='Количество добавлений в избранное')
-    def favorites_count(self, obj):
-        """
-        Возвращает количество добавлений в избранное.
-        """
-        return obj.favorites_count
-
 
 @admin.register(IngredientInRecipe)
 class IngredientInRecipeAdmin(admin.ModelAdmin):
@@ -65,4 +51,10 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
     list_filter = ('recipe',)
 
 
+@admin.register(TrendingRecipe)
+class TrendingRecipeAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'score', 'computed_at')
+    list_select_related = ('recipe',)
+
+
 admin.site.unregister(Group)
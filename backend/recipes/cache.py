@@ -0,0 +1,26 @@
+"""
+Кэши приложения recipes.
+
+reference_data - справочники (теги, ингредиенты), каждая таблица
+в своей группе инвалидации.
+recipe_data - не зависящее от пользователя представление рецептов,
+группа на каждый рецепт.
+user_data - публичные профили пользователей, группа на пользователя.
+"""
+from foodgram.cache import NamespacedCache
+
+reference_data = NamespacedCache('reference_data')
+recipe_data = NamespacedCache('recipes')
+user_data = NamespacedCache('users')
+
+# Группы инвалидации справочников
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+
+
+def recipe_group(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_group(user_id):
+    return f'user:{user_id}'
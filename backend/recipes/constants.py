@@ -7,3 +7,4 @@ INGREDIENT_NAME_MAX_LENGTH = 128
 MEASUREMENT_UNIT_MAX_LENGTH = 64
 COOKING_TIME_MIN_VALUE = 1
 AMOUNT_MIN_VALUE = 1
+INGREDIENT_SEARCH_LIMIT = 50
@@ -0,0 +1,60 @@
+"""
+Денормализованные счётчики рецептов и пользователей.
+
+change_counter() меняет счётчик атомарно на стороне БД,
+reconcile_counter() пересчитывает его по фактическим связям
+и исправляет расхождения.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import (
+    Favorite, Recipe, ShoppingCart, Subscription, UserModel)
+
+# (модель, счётчик, связанная модель, поле связи с моделью)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_cart_count', ShoppingCart, 'recipe'),
+    (UserModel, 'recipes_count', Recipe, 'author'),
+    (UserModel, 'subscribers_count', Subscription, 'subscribed_to'),
+)
+
+
+def change_counter(model, pk, counter, delta):
+    """
+    Увеличивает (или уменьшает) счётчик одним UPDATE без чтения строки.
+    Значение не опускается ниже нуля, даже если счётчик разошёлся
+    с данными.
+    """
+    model.objects.filter(pk=pk).update(
+        **{counter: Greatest(F(counter) + delta, 0)})
+
+
+def actual_count(related_model, related_field):
+    """Подзапрос с фактическим числом связанных строк для OuterRef('pk')."""
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{related_field: OuterRef('pk')}
+            ).order_by().values(related_field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_counter(model, counter, related_model, related_field,
+                      pk_range=None, dry_run=False):
+    """
+    Исправляет значения счётчика, расходящиеся с данными, одним
+    UPDATE на диапазон pk. Возвращает число исправленных строк.
+    """
+    actual = actual_count(related_model, related_field)
+    queryset = model.objects.exclude(**{counter: actual})
+    if pk_range is not None:
+        queryset = queryset.filter(pk__range=pk_range)
+    if dry_run:
+        return queryset.count()
+    return queryset.update(**{counter: actual})
@@ -0,0 +1,230 @@
+"""
+Варианты изображений рецептов и аватаров.
+
+Запрос сохраняет только оригинал. Уменьшенные копии (варианты)
+в форматах WebP и JPEG строятся в фоновом пуле потоков после
+фиксации транзакции и записываются в поле вариантов модели:
+
+    {'source': 'recipes/images/a.png',
+     'card': {'webp': 'recipes/images/variants/ab/<hash>.webp',
+              'jpeg': 'recipes/images/variants/cd/<hash>.jpg'},
+     ...}
+
+Хранилище адресует файлы по содержимому (foodgram/storage.py):
+у одинаковых оригиналов одно имя, и если для такого оригинала варианты
+уже построены, они переиспользуются без повторной обработки. Если
+процесс завершился раньше, чем пул обработал задачу, варианты
+достраивает команда build_image_variants.
+
+Файлы заменённых и удалённых изображений освобождаются в том же
+пуле (release_files), а не в запросе. Файлы, которые так и не были
+освобождены, находит и удаляет команда collect_media.
+"""
+import io
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from recipes.cache import recipe_data, recipe_group, user_data, user_group
+from recipes.models import Recipe, UserModel
+
+logger = logging.getLogger(__name__)
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+# Формат -> (расширение файла, параметры сохранения Pillow)
+FORMATS = {
+    'webp': ('webp', {'quality': WEBP_QUALITY, 'method': 4}),
+    'jpeg': ('jpg', {'quality': JPEG_QUALITY, 'optimize': True,
+                     'progressive': True}),
+}
+
+# field - поле с оригиналом, variants_field - поле с вариантами,
+# sizes - вариант -> наибольшие ширина и высота,
+# cache и group - кэш представления объекта, который нужно сбросить
+ImageSpec = namedtuple(
+    'ImageSpec', 'field variants_field sizes cache group')
+
+IMAGE_SPECS = {
+    Recipe: ImageSpec(
+        'image', 'image_variants',
+        {'thumbnail': (160, 160), 'card': (480, 480), 'full': (1280, 1280)},
+        recipe_data, recipe_group),
+    UserModel: ImageSpec(
+        'avatar', 'avatar_variants',
+        {'thumbnail': (96, 96), 'full': (320, 320)},
+        user_data, user_group),
+}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='image-variants')
+    return _executor
+
+
+def needs_variants(instance):
+    """Варианты не построены для текущего оригинала."""
+    spec = IMAGE_SPECS[type(instance)]
+    name = getattr(instance, spec.field).name
+    variants = getattr(instance, spec.variants_field) or {}
+    return bool(name) and variants.get('source') != name
+
+
+def clear_variants(instance):
+    """Убирает варианты удалённого изображения."""
+    spec = IMAGE_SPECS[type(instance)]
+    if getattr(instance, spec.variants_field):
+        setattr(instance, spec.variants_field, {})
+        type(instance).objects.filter(pk=instance.pk).update(
+            **{spec.variants_field: {}})
+
+
+def image_files(name, variants):
+    """
+    Файлы оригинала name и его вариантов. Один файл может встречаться
+    несколько раз: на каждое вхождение в хранилище своя ссылка.
+    """
+    if not name:
+        return []
+    files = [name]
+    variants = variants or {}
+    if variants.get('source') == name:
+        for variant, formats in variants.items():
+            if variant != 'source':
+                files.extend(formats.values())
+    return files
+
+
+def stored_image(instance):
+    """Оригинал и варианты объекта в том виде, как они сохранены в БД."""
+    spec = IMAGE_SPECS[type(instance)]
+    return type(instance).objects.filter(pk=instance.pk).values_list(
+        spec.field, spec.variants_field).first()
+
+
+def release_files(model, names):
+    """
+    Ставит освобождение файлов в фоновый пул после фиксации
+    транзакции: при откате файлы остаются на месте.
+    """
+    if not names:
+        return
+    storage = model._meta.get_field(IMAGE_SPECS[model].field).storage
+    names = list(names)
+    transaction.on_commit(lambda: _get_executor().submit(
+        _release_in_background, storage, names))
+
+
+def _release_in_background(storage, names):
+    try:
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception:
+                logger.exception('Не удалось удалить файл %s', name)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance):
+    """
+    Ставит построение вариантов в фоновый пул после фиксации
+    транзакции, чтобы поток увидел сохранённый оригинал.
+    """
+    model = type(instance)
+    name = getattr(instance, IMAGE_SPECS[model].field).name
+    transaction.on_commit(lambda: _get_executor().submit(
+        _build_in_background, model, instance.pk, name))
+
+
+def _build_in_background(model, pk, name):
+    try:
+        build_variants(model, pk, name)
+    except Exception:
+        logger.exception('Не удалось построить варианты %s для %s #%s',
+                         name, model.__name__, pk)
+    finally:
+        # Поток пула не проходит через обработку запроса,
+        # соединение с БД закрываем сами
+        close_old_connections()
+
+
+def build_variants(model, pk, name):
+    """
+    Строит и сохраняет варианты оригинала name объекта model с pk.
+    Если оригинал успели заменить, результат не записывается,
+    а ссылки на файлы вариантов освобождаются.
+    Возвращает словарь вариантов или None.
+    """
+    spec = IMAGE_SPECS[model]
+    field = model._meta.get_field(spec.field)
+    storage = field.storage
+
+    variants = _reuse_variants(model, spec, storage, pk, name)
+    if variants is None:
+        with storage.open(name, 'rb') as original:
+            image = ImageOps.exif_transpose(Image.open(original))
+            image.load()
+
+        variants = {'source': name}
+        for variant, size in spec.sizes.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            variants[variant] = {}
+            for image_format, (extension, options) in FORMATS.items():
+                variants[variant][image_format] = storage.save(
+                    f'{field.upload_to}variants/{variant}.{extension}',
+                    ContentFile(_encode(resized, image_format, options)))
+
+    updated = model.objects.filter(pk=pk, **{spec.field: name}).update(
+        **{spec.variants_field: variants})
+    if not updated:
+        # Оригинал заменили или объект удалили: ссылки, взятые
+        # на сохранённые или переиспользованные файлы, возвращаем
+        for file_name in image_files(name, variants)[1:]:
+            storage.delete(file_name)
+        return None
+    spec.cache.invalidate(spec.group(pk))
+    return variants
+
+
+def _reuse_variants(model, spec, storage, pk, name):
+    """
+    Варианты другого объекта с тем же оригиналом. На каждый файл
+    добавляется ссылка, чтобы удаление одного объекта не удалило
+    файлы, которыми пользуется другой.
+    """
+    if not hasattr(storage, 'retain'):
+        return None
+    variants = model.objects.filter(
+        **{spec.field: name, f'{spec.variants_field}__source': name}
+    ).exclude(pk=pk).values_list(spec.variants_field, flat=True).first()
+    if variants is None:
+        return None
+    for variant, files in variants.items():
+        if variant != 'source':
+            for file_name in files.values():
+                storage.retain(file_name)
+    return variants
+
+
+def _encode(image, image_format, options):
+    if image_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        # В JPEG нет прозрачности: кладём картинку на белый фон
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.upper(), **options)
+    return buffer.getvalue()
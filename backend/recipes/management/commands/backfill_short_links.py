@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import Recipe
+from recipes.short_codes import PENDING_LENGTH, encode_short_link
+
+
+class Command(BaseCommand):
+    help = ('Назначает короткие ссылки рецептам без кода или с временным '
+            'кодом. Уже выданные ссылки не меняются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов обновлять за один запрос')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать рецепты без кода')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Recipe.objects.filter(
+            Q(short_link='')
+            | Q(short_link__regex=rf'^[0-9a-f]{{{PENDING_LENGTH}}}$')
+        ).order_by('pk')
+
+        total = 0
+        last_pk = 0
+        while True:
+            # Keyset-пагинация по pk: каждая пачка - один SELECT id
+            # и один UPDATE, без загрузки строк целиком
+            pks = list(queryset.filter(pk__gt=last_pk).values_list(
+                'pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            total += len(pks)
+            if options['dry_run']:
+                continue
+            with transaction.atomic():
+                Recipe.objects.bulk_update(
+                    [Recipe(pk=pk, short_link=encode_short_link(pk))
+                     for pk in pks],
+                    ['short_link'], batch_size=batch_size)
+
+        if options['dry_run']:
+            self.stdout.write(f'Рецептов без короткой ссылки: {total}')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Назначено коротких ссылок: {total}'))
@@ -0,0 +1,239 @@
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Ingredient, Recipe, ShoppingCart, Subscription, Tag, UserModel)
+
+# Эндпоинт -> (URL-шаблон, нужна ли авторизация, бюджет запросов к БД,
+# бюджет p95 в мс). Шаблоны заполняются данными из базы, см. _context().
+# Бюджеты запросов рассчитаны на прогретый кэш; с --cold-cache
+# сравнивается только время.
+ENDPOINTS = {
+    'recipes-list': ('/api/recipes/', False, 4, 300),
+    'recipes-list-auth': ('/api/recipes/', True, 5, 300),
+    'recipes-list-filtered': (
+        '/api/recipes/?tags={tag}&is_favorited=1&ingredient_name={word}',
+        True, 6, 300),
+    'recipes-list-cursor': (
+        '/api/recipes/?pagination=cursor&ordering=popular', True, 4, 300),
+    'recipes-trending': ('/api/recipes/trending/', False, 4, 300),
+    'recipe-detail': ('/api/recipes/{recipe}/', False, 0, 100),
+    'recipe-detail-auth': ('/api/recipes/{recipe}/', True, 3, 100),
+    'recipe-get-link': ('/api/recipes/{recipe}/get-link/', False, 3, 100),
+    'shopping-cart-download': (
+        '/api/recipes/download_shopping_cart/', True, 3, 500),
+    'ingredients-search': ('/api/ingredients/?name={word}', False, 0, 100),
+    'tags-list': ('/api/tags/', False, 0, 100),
+    'users-list': ('/api/users/', True, 4, 300),
+    'user-detail': ('/api/users/{author}/', True, 3, 100),
+    'users-me': ('/api/users/me/', True, 2, 100),
+    'subscriptions': (
+        '/api/users/subscriptions/?recipes_limit=3', True, 5, 300),
+    'short-link-redirect': ('/r/{short_link}/', False, 1, 100),
+}
+# TTL пространств кэша, выключенных в настройках, на время замера
+WARM_CACHE_TIMEOUT = 60 * 10
+
+
+class Command(BaseCommand):
+    help = ('Замеряет эндпоинты API: число запросов к БД, задержку '
+            'p50/p95 и выделения памяти. Результат выводится в JSON, '
+            'при превышении бюджета команда завершается с ошибкой. '
+            'Запускать на наполненной базе (seed_load_data).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=30,
+                            help='Сколько раз запрашивать каждый эндпоинт')
+        parser.add_argument('--endpoint', action='append',
+                            choices=sorted(ENDPOINTS),
+                            help='Замерить только указанные эндпоинты')
+        parser.add_argument('--user', type=int,
+                            help='id пользователя для авторизованных '
+                                 'запросов')
+        parser.add_argument('--budgets',
+                            help='JSON-файл с бюджетами вида '
+                                 '{"эндпоинт": {"queries": 5, "p95_ms": 200}}')
+        parser.add_argument('--cold-cache', action='store_true',
+                            help='Выключить кэш приложения')
+        parser.add_argument('--output',
+                            help='Файл для JSON-результата '
+                                 '(по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        budgets = {name: {'queries': queries, 'p95_ms': p95_ms}
+                   for name, (_, _, queries, p95_ms) in ENDPOINTS.items()}
+        if options['budgets']:
+            with open(options['budgets'], encoding='utf-8') as file:
+                for name, budget in json.load(file).items():
+                    budgets.setdefault(name, {}).update(budget)
+        if options['cold_cache']:
+            for budget in budgets.values():
+                budget.pop('queries', None)
+
+        user, context = self._context(options['user'])
+        anonymous = self._client()
+        authenticated = self._client()
+        authenticated.force_authenticate(user)
+
+        if options['cold_cache']:
+            cache_settings = {
+                'CACHE_NAMESPACES': {name: 0
+                                     for name in settings.CACHE_NAMESPACES},
+                'REFERENCE_DATA_LOCAL_TTL': 0,
+            }
+        else:
+            # С locmem пространства имён по умолчанию выключены,
+            # а бюджеты рассчитаны на прогретый кэш: включаем их
+            cache_settings = {
+                'CACHE_NAMESPACES': {
+                    name: timeout or WARM_CACHE_TIMEOUT
+                    for name, timeout in settings.CACHE_NAMESPACES.items()},
+                'REFERENCE_DATA_LOCAL_TTL': (settings.REFERENCE_DATA_LOCAL_TTL
+                                             or WARM_CACHE_TIMEOUT),
+            }
+        results = {}
+        with override_settings(**cache_settings):
+            for name in options['endpoint'] or ENDPOINTS:
+                template, auth, _, _ = ENDPOINTS[name]
+                results[name] = self._measure(
+                    authenticated if auth else anonymous,
+                    template.format(**context), options['repeat'])
+                results[name]['budget'] = budgets.get(name, {})
+                results[name]['failures'] = _check_budget(results[name])
+
+        report = {
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'cold_cache': options['cold_cache'],
+            'repeat': options['repeat'],
+            'dataset': {
+                'users': UserModel.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'endpoints': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        failed = {name: result['failures']
+                  for name, result in results.items() if result['failures']}
+        for name, failures in failed.items():
+            sys.stderr.write(f'{name}: {"; ".join(failures)}\n')
+        if failed:
+            raise CommandError(f'Бюджет превышен: {", ".join(failed)}')
+
+    @staticmethod
+    def _client():
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                     if host != '*'), 'localhost')
+        return APIClient(SERVER_NAME=host)
+
+    @staticmethod
+    def _context(user_id):
+        """Пользователь для авторизованных запросов и значения для URL."""
+        if user_id is not None:
+            user = UserModel.objects.filter(pk=user_id).first()
+        else:
+            # Пользователь с корзиной и подписками нагружает больше
+            # эндпоинтов, чем случайный
+            user = UserModel.objects.filter(
+                pk__in=ShoppingCart.objects.values('user')).filter(
+                pk__in=Subscription.objects.values('user')).first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if None in (user, recipe, tag, ingredient):
+            raise CommandError('База пуста: сначала выполните seed_load_data.')
+        return user, {
+            'recipe': recipe.pk,
+            'short_link': recipe.short_link,
+            'author': recipe.author_id,
+            'tag': tag.slug,
+            'word': ingredient.name.split()[0][:3],
+        }
+
+    @staticmethod
+    def _measure(client, url, repeat):
+        """
+        Один прогревочный запрос, затем repeat замеров времени и один
+        запрос под tracemalloc (трассировка сама замедляет код, поэтому
+        на замер времени не влияет).
+        """
+        _request(client, url)
+        # CaptureQueriesContext здесь не подходит: сигнал request_started
+        # очищает connection.queries посреди замера
+        queries = _QueryCounter()
+        with connection.execute_wrapper(queries):
+            status = _request(client, url)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _request(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        tracemalloc.start()
+        try:
+            _request(client, url)
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'url': url,
+            'status': status,
+            'queries': queries.count,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(
+                timings[max(0, int(len(timings) * 0.95 + 0.5) - 1)], 2),
+            'retained_kib': round(retained / 1024, 1),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+
+class _QueryCounter:
+    """Обёртка выполнения SQL, считающая запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _request(client, url):
+    """Выполняет GET и дочитывает потоковый ответ, возвращает статус."""
+    response = client.get(url)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response.status_code
+
+
+def _check_budget(result):
+    failures = []
+    if result['status'] >= 400:
+        failures.append(f'статус {result["status"]}')
+    budget = result['budget']
+    if 'queries' in budget and result['queries'] > budget['queries']:
+        failures.append(
+            f'запросов {result["queries"]} > {budget["queries"]}')
+    if 'p95_ms' in budget and result['p95_ms'] > budget['p95_ms']:
+        failures.append(f'p95 {result["p95_ms"]} мс > {budget["p95_ms"]} мс')
+    return failures
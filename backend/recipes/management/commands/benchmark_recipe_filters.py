@@ -0,0 +1,111 @@
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from recipes.models import Ingredient, Recipe, Tag, UserModel
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает план и время фильтров ленты рецептов: прежние '
+            'JOIN (+ DISTINCT) и текущие подзапросы EXISTS в RecipeFilter. '
+            'Запускать на наполненной базе (seed_load_data).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Сколько раз выполнять каждый запрос')
+        parser.add_argument('--limit', type=int, default=10,
+                            help='Размер страницы')
+        parser.add_argument('--user', type=int,
+                            help='id пользователя для is_favorited и '
+                                 'is_in_shopping_cart (по умолчанию - '
+                                 'у кого больше всего избранного)')
+        parser.add_argument('--explain', action='store_true',
+                            help='Вывести планы запросов (EXPLAIN ANALYZE '
+                                 'на PostgreSQL)')
+
+    def handle(self, *args, **options):
+        user = self._get_user(options['user'])
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:3])
+        ingredient = Ingredient.objects.order_by('?').values_list(
+            'name', flat=True).first()
+        if not slugs or ingredient is None or user is None:
+            raise CommandError('База пуста: сначала выполните seed_load_data.')
+        word = ingredient.split()[0][:4]
+
+        # Сценарий -> (параметры запроса, выборка в прежнем виде)
+        base = Recipe.objects.all()
+        scenarios = {
+            'tags (1)': ({'tags': slugs[:1]},
+                         base.filter(tags__slug__in=slugs[:1]).distinct()),
+            f'tags ({len(slugs)})': (
+                {'tags': slugs},
+                base.filter(tags__slug__in=slugs).distinct()),
+            'is_favorited': ({'is_favorited': '1'},
+                             base.filter(favorites__user=user)),
+            'is_in_shopping_cart': ({'is_in_shopping_cart': '1'},
+                                    base.filter(in_cart__user=user)),
+            'ingredient_name': (
+                {'ingredient_name': word},
+                base.filter(ingredients__name__icontains=word)),
+            'tags + is_favorited': (
+                {'tags': slugs, 'is_favorited': '1'},
+                base.filter(tags__slug__in=slugs,
+                            favorites__user=user).distinct()),
+        }
+
+        request = SimpleNamespace(user=user)
+        self.stdout.write(
+            f'{"сценарий":<24}{"JOIN, мс":>12}{"EXISTS, мс":>14}'
+            f'{"строк":>8}')
+        for name, (params, legacy) in scenarios.items():
+            data = QueryDict(mutable=True)
+            for key, value in params.items():
+                if isinstance(value, list):
+                    data.setlist(key, value)
+                else:
+                    data[key] = value
+            current = RecipeFilter(data, queryset=base, request=request).qs
+            legacy = legacy.order_by('name', 'id')[:options['limit']]
+            current = current.order_by('name', 'id')[:options['limit']]
+
+            legacy_ms = self._measure(legacy, options['repeat'])
+            current_ms = self._measure(current, options['repeat'])
+            self.stdout.write(
+                f'{name:<24}{legacy_ms:>12.2f}{current_ms:>14.2f}'
+                f'{len(current):>8}')
+            if options['explain']:
+                self._explain('JOIN', legacy)
+                self._explain('EXISTS', current)
+
+    @staticmethod
+    def _get_user(user_id):
+        if user_id is not None:
+            return UserModel.objects.filter(pk=user_id).first()
+        # Пользователь с наибольшим избранным: на нём фильтр
+        # is_favorited выбирает больше всего строк
+        return UserModel.objects.annotate(
+            favorites_total=Count('favorites')
+        ).order_by('-favorites_total', 'pk').first()
+
+    @staticmethod
+    def _measure(queryset, repeat):
+        """Медиана времени выполнения запроса в миллисекундах."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset._chain())
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def _explain(self, title, queryset):
+        options = ({'analyze': True, 'buffers': True}
+                   if connection.vendor == 'postgresql' else {})
+        self.stdout.write(f'  -- {title}')
+        for line in queryset.explain(**options).splitlines():
+            self.stdout.write(f'     {line}')
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes.images import IMAGE_SPECS, build_variants, needs_variants
+
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии изображений рецептов и аватаров, '
+            'для которых их ещё нет (после массовой загрузки или если '
+            'фоновая обработка не успела завершиться)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Сколько изображений обрабатывать '
+                                 'параллельно')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать изображения без копий')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model, spec in IMAGE_SPECS.items():
+                pending = (
+                    (obj.pk, getattr(obj, spec.field).name)
+                    for obj in model.objects.exclude(
+                        **{spec.field: ''}
+                    ).exclude(**{f'{spec.field}__isnull': True}).only(
+                        'pk', spec.field, spec.variants_field
+                    ).iterator(chunk_size=CHUNK_SIZE)
+                    if needs_variants(obj))
+                if options['dry_run']:
+                    self.stdout.write(f'{model._meta.model_name}: '
+                                      f'без копий {sum(1 for _ in pending)}')
+                    continue
+                built = failed = 0
+                for result in executor.map(
+                        lambda item: self._build(model, *item), pending):
+                    built += result
+                    failed += not result
+                self.stdout.write(f'{model._meta.model_name}: построено '
+                                  f'{built}, ошибок {failed}')
+
+    def _build(self, model, pk, name):
+        try:
+            build_variants(model, pk, name)
+        except Exception as error:
+            self.stderr.write(f'{model._meta.model_name} #{pk} {name}: '
+                              f'{error}')
+            return False
+        finally:
+            close_old_connections()
+        return True
@@ -0,0 +1,119 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes.images import FORMATS, IMAGE_SPECS
+from recipes.models import StoredFile
+
+BATCH_SIZE = 2000
+VARIANTS_DIR = '/variants/'
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы изображений рецептов и аватаров, на которые '
+            'не ссылается ни один объект: заменённые картинки, '
+            'устаревшие варианты, остатки прерванных загрузок. '
+            'Запускается периодически (cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Сколько файлов сверять с БД за запрос')
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Не трогать файлы моложе N минут: загрузка могла '
+                 'ещё не зафиксировать ссылку на файл')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.cutoff = time.time() - options['min_age'] * 60
+        verb = 'будет удалено' if self.dry_run else 'удалено'
+        for model, spec in IMAGE_SPECS.items():
+            field = model._meta.get_field(spec.field)
+            storage = field.storage
+            files = self._walk(storage, storage.path(field.upload_to))
+            scanned = orphans = size = 0
+            while True:
+                batch = dict(islice(files, options['batch_size']))
+                if not batch:
+                    break
+                scanned += len(batch)
+                referenced = self._referenced(model, spec, list(batch))
+                orphaned = [name for name in batch if name not in referenced]
+                for name in self._remove(storage, orphaned):
+                    orphans += 1
+                    size += batch[name]
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'  {name}')
+            self.stdout.write(
+                f'{model._meta.model_name}: проверено {scanned}, '
+                f'{verb} {orphans} ({size / 1024 / 1024:.1f} МБ)')
+
+    def _walk(self, storage, root):
+        """
+        Обходит каталог без построения полного списка файлов и отдаёт
+        (имя в хранилище, размер) для файлов старше --min-age.
+        """
+        directories = [root]
+        while directories:
+            try:
+                entries = os.scandir(directories.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_mtime < self.cutoff:
+                            name = os.path.relpath(entry.path,
+                                                   storage.location)
+                            yield name.replace(os.sep, '/'), stat.st_size
+
+    def _referenced(self, model, spec, names):
+        """Имена из names, на которые ссылаются объекты model."""
+        originals = [name for name in names if VARIANTS_DIR not in name]
+        variants = [name for name in names if VARIANTS_DIR in name]
+        referenced = set()
+        if originals:
+            referenced.update(model.objects.filter(
+                **{f'{spec.field}__in': originals}
+            ).values_list(spec.field, flat=True))
+        if variants:
+            query = Q()
+            for variant in spec.sizes:
+                for image_format in FORMATS:
+                    query |= Q(**{f'{spec.variants_field}__{variant}__'
+                                  f'{image_format}__in': variants})
+            for value in model.objects.filter(query).values_list(
+                    spec.variants_field, flat=True).iterator():
+                for variant, files in value.items():
+                    if variant != 'source':
+                        referenced.update(files.values())
+        return referenced
+
+    def _remove(self, storage, names):
+        """
+        Удаляет файлы и их счётчики ссылок, отдаёт удалённые имена.
+        Файл, использованный повторно после сверки с БД (хранилище
+        обновляет его время изменения), пропускается.
+        """
+        removed = []
+        for name in names:
+            path = storage.path(name)
+            try:
+                if os.stat(path).st_mtime >= self.cutoff:
+                    continue
+                if not self.dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed.append(name)
+        if removed and not self.dry_run:
+            StoredFile.objects.filter(name__in=removed).delete()
+        return removed
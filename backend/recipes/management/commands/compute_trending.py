@@ -0,0 +1,60 @@
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import Favorite, ShoppingCart, TrendingRecipe
+
+CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярных рецептов для '
+            '/api/recipes/trending/. Запускается периодически (cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life-hours', type=float, default=48,
+            help='За сколько часов вклад добавления уменьшается вдвое')
+        parser.add_argument(
+            '--window-days', type=int, default=14,
+            help='Учитывать добавления только за последние N дней')
+        parser.add_argument(
+            '--cart-weight', type=float, default=0.5,
+            help='Вес добавления в корзину относительно избранного')
+        parser.add_argument(
+            '--limit', type=int, default=500,
+            help='Сколько рецептов сохранять в рейтинге')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        since = now - timedelta(days=options['window_days'])
+        half_life = options['half_life_hours']
+
+        # Рейтинг - сумма вкладов добавлений в избранное и в корзину,
+        # каждый вклад затухает экспоненциально с возрастом
+        scores = defaultdict(float)
+        for model, weight in ((Favorite, 1.0),
+                              (ShoppingCart, options['cart_weight'])):
+            events = model.objects.filter(created__gte=since).values_list(
+                'recipe_id', 'created').iterator(chunk_size=CHUNK_SIZE)
+            for recipe_id, created in events:
+                age_hours = (now - created).total_seconds() / 3600
+                scores[recipe_id] += weight * 0.5 ** (age_hours / half_life)
+
+        top = heapq.nlargest(options['limit'], scores.items(),
+                             key=itemgetter(1))
+        with transaction.atomic():
+            TrendingRecipe.objects.all().delete()
+            TrendingRecipe.objects.bulk_create(
+                TrendingRecipe(recipe_id=recipe_id, score=score,
+                               computed_at=now)
+                for recipe_id, score in top
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан: {len(top)} рецептов.'))
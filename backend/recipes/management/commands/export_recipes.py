@@ -0,0 +1,76 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import IngredientInRecipe, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с тегами, ингредиентами и ссылками '
+            'на изображения в JSON Lines (по рецепту на строку). '
+            'Файл загружается обратно командой import_recipes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='Путь к файлу, по умолчанию - stdout')
+        parser.add_argument('--author',
+                            help='Выгрузить только рецепты автора '
+                                 'с этим email')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Сколько рецептов читать из БД за раз')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('pk').select_related(
+            'author'
+        ).only(
+            'name', 'text', 'cooking_time', 'image', 'pub_date',
+            'author__email'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('slug')),
+            Prefetch('ingredients_in_recipe',
+                     queryset=IngredientInRecipe.objects.select_related(
+                         'ingredient').order_by('pk')),
+        )
+        if options['author']:
+            recipes = recipes.filter(author__email=options['author'])
+        recipes = recipes.iterator(chunk_size=options['batch_size'])
+
+        output = options['output']
+        if output == '-':
+            _write(self.stdout, recipes)
+            return
+        # Пишем во временный файл и подменяем атомарно, чтобы
+        # прерванная выгрузка не оставила файл наполовину
+        tmp_path = f'{output}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            count = _write(file, recipes)
+        os.replace(tmp_path, output)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {count} в {output}'))
+
+
+def _write(file, recipes):
+    count = 0
+    for recipe in recipes:
+        file.write(json.dumps(_record(recipe), ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def _record(recipe):
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'pub_date': recipe.pub_date.isoformat(),
+        'author': recipe.author.email,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {'name': item.ingredient.name,
+             'measurement_unit': item.ingredient.measurement_unit,
+             'amount': item.amount}
+            for item in recipe.ingredients_in_recipe.all()],
+    }
@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from recipes.short_links import write_nginx_map
+
+
+class Command(BaseCommand):
+    help = ('Выгружает короткие ссылки в map-файл nginx, чтобы переходы '
+            'по ним обслуживались без обращения к Django')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='/app/short_links/short_links.map',
+            help='Путь к map-файлу nginx')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        # Пишем во временный файл и подменяем атомарно, чтобы nginx
+        # при перезагрузке не прочитал файл наполовину
+        tmp_path = f'{output}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            count = write_nginx_map(file)
+        os.replace(tmp_path, output)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено коротких ссылок: {count} в {output}. '
+            'Перезагрузите nginx: nginx -s reload'))
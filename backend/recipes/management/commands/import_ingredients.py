@@ -1,49 +1,244 @@
 import csv
+import io
+import itertools
+import json
+import time
+from functools import partial
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+
+from recipes.cache import INGREDIENTS, reference_data
+from recipes.constants import (
+    INGREDIENT_NAME_MAX_LENGTH, MEASUREMENT_UNIT_MAX_LENGTH)
 from recipes.models import Ingredient
 
+DEFAULT_PATH = settings.BASE_DIR / 'data' / 'ingredients.csv'
+FORMATS = ('csv', 'json', 'jsonl')
+CSV_HEADER = ['name', 'measurement_unit']
+READ_SIZE = 64 * 1024
+# Элемент JSON-массива длиннее этого считается повреждённым: иначе
+# после ошибки в элементе reader дочитывал бы в буфер весь файл
+MAX_ELEMENT_SIZE = 64 * 1024
+# Сколько отклонённых строк показывать при обычной подробности вывода
+REJECTED_SHOWN = 20
+STAGING_TABLE = 'ingredient_import'
+
 
 class Command(BaseCommand):
-    help = 'Импортирует ингредиенты из CSV файла'
+    help = ('Импортирует ингредиенты из CSV, JSON или JSON Lines. '
+            'Файл читается потоком и загружается пачками; ингредиенты, '
+            'которые уже есть (то же название и единица измерения), '
+            'пропускаются.')
 
-    def handle(self, *args, **kwargs):
-        # Захардкоженный путь к файлу
-        csv_file_path = '/app/data/ingredients.csv'
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=Path, default=DEFAULT_PATH,
+                            help='Путь к файлу с ингредиентами')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Формат файла, по умолчанию - '
+                                 'по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--copy', action='store_true',
+                            help='Загружать через COPY во временную '
+                                 'таблицу (только PostgreSQL)')
 
-        ingredients_to_create = []
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError(
+                f'Не удалось определить формат {path}, укажите --format.')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только на PostgreSQL.')
+        self.verbosity = options['verbosity']
+        self.rejected = 0
 
+        started = time.monotonic()
+        read = imported = 0
         try:
-            # Открытие CSV файла
-            with open(csv_file_path, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    # Если строка состоит из двух
-                    # элементов (название, единица измерения)
-                    if len(row) == 2:
-                        name = row[0].strip()
-                        measurement_unit = row[1].strip()
-
-                        # Добавление объектов в список
-                        ingredients_to_create.append(Ingredient(
-                            name=name,
-                            measurement_unit=measurement_unit
-                        ))
-
-                    else:
-                        self.stdout.write(self.style.WARNING(
-                            f'Пропущена строка с неверным форматом: {row}'))
-
-            if ingredients_to_create:
-                # bulk_create для добавления всех ингредиентов за один запрос
-                Ingredient.objects.bulk_create(ingredients_to_create,
-                                               ignore_conflicts=True)
-                self.stdout.write(
-                    self.style.SUCCESS('Ингредиенты успешно добавлены.'))
-
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = self._clean_rows(READERS[file_format](file))
+                if options['copy']:
+                    upsert = self._upsert_copy
+                    self._create_staging_table()
+                else:
+                    upsert = self._upsert
+                for batch in _batches(rows, options['batch_size']):
+                    read += len(batch)
+                    imported += upsert(batch)
         except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(
-                f'Файл {csv_file_path} не найден.'))
+            raise CommandError(f'Файл {path} не найден.')
+        except (ValueError, csv.Error) as error:
+            raise CommandError(f'Файл {path} повреждён: {error}')
+        finally:
+            if options['copy']:
+                self._drop_staging_table()
+
+        if imported:
+            # Вставка идёт в обход save(), сигналы не отправляются
+            reference_data.invalidate(INGREDIENTS)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read + self.rejected}, добавлено {imported}, '
+            f'пропущено {read - imported}, отклонено {self.rejected} '
+            f'за {elapsed:.1f} с ({read / max(elapsed, 1e-6):.0f} строк/с)'))
+
+    def _clean_rows(self, records):
+        """Проверенные (название, единица измерения) без пробелов по краям."""
+        for position, record in records:
+            try:
+                yield _clean(record)
+            except ValueError as error:
+                self.rejected += 1
+                if self.verbosity > 1 or self.rejected <= REJECTED_SHOWN:
+                    self.stderr.write(self.style.WARNING(
+                        f'Строка {position} отклонена ({error}): {record}'))
+
+    def _upsert(self, batch):
+        """
+        Вставляет пачку, пропуская существующие ингредиенты.
+        Возвращает число добавленных.
+        """
+        new = set(batch)
+        new.difference_update(Ingredient.objects.filter(
+            name__in={name for name, _ in new}
+        ).values_list('name', 'measurement_unit'))
+        ingredients = [Ingredient(name=name, measurement_unit=unit)
+                       for name, unit in new]
+        try:
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(ingredients)
+            return len(ingredients)
+        except IntegrityError:
+            # Часть строк успели вставить параллельно. ignore_conflicts
+            # не сообщает, сколько строк пропущено, поэтому пачка
+            # вставляется заново по одной строке
+            return sum(
+                Ingredient.objects.get_or_create(
+                    name=ingredient.name,
+                    measurement_unit=ingredient.measurement_unit)[1]
+                for ingredient in ingredients)
+
+    def _create_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {STAGING_TABLE} '
+                f'(name text, measurement_unit text)')
+
+    def _drop_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+
+    def _upsert_copy(self, batch):
+        """Загружает пачку через COPY и переносит новые строки."""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} (name, measurement_unit) '
+                f'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM {STAGING_TABLE} '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            return cursor.rowcount
+
+
+def _clean(record):
+    if isinstance(record, dict):
+        name = record.get('name')
+        unit = record.get('measurement_unit')
+    elif isinstance(record, list) and len(record) == 2:
+        name, unit = record
+    else:
+        raise ValueError('ожидались название и единица измерения')
+    if not isinstance(name, str) or not isinstance(unit, str):
+        raise ValueError('значения должны быть строками')
+    name, unit = name.strip(), unit.strip()
+    if not name or not unit:
+        raise ValueError('пустое значение')
+    if (len(name) > INGREDIENT_NAME_MAX_LENGTH
+            or len(unit) > MEASUREMENT_UNIT_MAX_LENGTH):
+        raise ValueError('слишком длинное значение')
+    return name, unit
+
+
+def _read_csv(file):
+    """Строки CSV "название,единица", необязательный заголовок."""
+    for number, row in enumerate(csv.reader(file), 1):
+        if number == 1 and row == CSV_HEADER:
+            continue
+        if row:
+            yield number, row
+
+
+def _read_jsonl(file):
+    """Объекты JSON Lines; строка с ошибкой отклоняется целиком."""
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError:
+            yield number, line
+
+
+def _read_json(file):
+    """
+    Элементы JSON-массива по одному: файл читается частями
+    и не загружается в память целиком. Повреждённый элемент
+    прерывает чтение с его номером.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, opened, number = '', 0, False, 0
+    error = None
+    for chunk in iter(partial(file.read, READ_SIZE), ''):
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not opened:
+                if buffer[position] != '[':
+                    raise ValueError('ожидался JSON-массив')
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as decode_error:
+                error = decode_error
+                if len(buffer) - position > MAX_ELEMENT_SIZE:
+                    raise _element_error(number + 1, error)
+                # Элемент не дочитан: ждём следующую часть файла
+                break
+            error = None
+            number += 1
+            yield number, item
+    if error is not None:
+        raise _element_error(number + 1, error)
+    raise ValueError('JSON-массив не завершён')
+
+
+def _element_error(number, error):
+    return ValueError(f'элемент {number} не разобран ({error.msg})')
+
+
+READERS = {'csv': _read_csv, 'json': _read_json, 'jsonl': _read_jsonl}
+
 
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Произошла ошибка: {str(e)}'))
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
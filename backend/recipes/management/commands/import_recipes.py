@@ -0,0 +1,267 @@
+import itertools
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.constants import (
+    AMOUNT_MIN_VALUE, COOKING_TIME_MIN_VALUE, INGREDIENT_NAME_MAX_LENGTH,
+    MEASUREMENT_UNIT_MAX_LENGTH, RECIPE_NAME_MAX_LENGTH)
+from recipes.counters import change_counter
+from recipes.models import (
+    Ingredient, IngredientInRecipe, Recipe, Tag, UserModel)
+from recipes.short_codes import encode_short_link, pending_short_link
+
+# Сколько отклонённых строк показывать при обычной подробности вывода
+REJECTED_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из JSON Lines (формат export_recipes) '
+            'пачками: рецепты, теги и ингредиенты каждой пачки '
+            'вставляются несколькими bulk-запросами в одной транзакции. '
+            'Изображения должны уже лежать в хранилище медиафайлов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=Path, required=True,
+                            help='Путь к файлу JSON Lines')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов вставлять '
+                                 'в одной транзакции')
+        parser.add_argument('--author',
+                            help='Email автора для всех рецептов вместо '
+                                 'указанных в файле')
+        parser.add_argument('--create-ingredients', action='store_true',
+                            help='Создавать отсутствующие ингредиенты '
+                                 'вместо отклонения рецепта')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.verbosity = options['verbosity']
+        self.storage = Recipe._meta.get_field('image').storage
+        # Справочники для сопоставления ссылок из файла с id в БД.
+        # Теги загружаются целиком, авторы и ингредиенты - по мере
+        # появления в пачках
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.authors = {}
+        self.ingredients = {}
+        self.images = set()
+        self.rejected = 0
+        if options['author']:
+            self._resolve_authors({options['author']})
+            if options['author'] not in self.authors:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден.')
+
+        started = time.monotonic()
+        imported = 0
+        try:
+            with open(Path(options['path']), encoding='utf-8') as file:
+                for batch in _batches(_read(file), options['batch_size']):
+                    imported += self._import_batch(batch)
+                    if self.verbosity > 1:
+                        self.stdout.write(f'Загружено {imported}')
+        except FileNotFoundError:
+            raise CommandError(f'Файл {options["path"]} не найден.')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов {imported}, отклонено {self.rejected} '
+            f'за {elapsed:.1f} с ({imported / max(elapsed, 1e-6):.0f} '
+            'рецептов/с). Уменьшенные копии изображений построит '
+            'команда build_image_variants.'))
+
+    def _import_batch(self, batch):
+        records = [record for _, record in batch
+                   if isinstance(record, dict)]
+        self._resolve_authors(record.get('author') for record in records)
+        self._resolve_ingredients(
+            (item.get('name'), item.get('measurement_unit'))
+            for record in records
+            if isinstance(record.get('ingredients'), list)
+            for item in record['ingredients'] if isinstance(item, dict))
+
+        prepared = []
+        for position, record in batch:
+            try:
+                prepared.append(self._prepare(record))
+            except ValueError as error:
+                self._reject(position, record, error)
+        if not prepared:
+            return 0
+
+        recipes = [recipe for recipe, _, _, _ in prepared]
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            # bulk_create не вызывает save(): коды коротких ссылок
+            # строим из полученных id, дату публикации берём из файла
+            # (auto_now_add её перезаписал)
+            for recipe, pub_date, _, _ in prepared:
+                recipe.short_link = encode_short_link(recipe.pk)
+                recipe.pub_date = pub_date or recipe.pub_date
+            Recipe.objects.bulk_update(recipes, ['short_link', 'pub_date'])
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe, _, tag_ids, _ in prepared for tag_id in tag_ids)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe_id=recipe.pk,
+                                   ingredient_id=ingredient_id,
+                                   amount=amount)
+                for recipe, _, _, ingredients in prepared
+                for ingredient_id, amount in ingredients)
+
+            authors = Counter(recipe.author_id for recipe in recipes)
+            for author_id, count in authors.items():
+                change_counter(UserModel, author_id, 'recipes_count', count)
+            if hasattr(self.storage, 'retain'):
+                # Новые объекты ссылаются на уже сохранённые файлы
+                for name, count in Counter(
+                        recipe.image.name for recipe in recipes).items():
+                    self.storage.retain(name, count)
+        return len(recipes)
+
+    def _prepare(self, record):
+        """
+        Проверяет запись и возвращает (несохранённый рецепт, дату
+        публикации, id тегов, [(id ингредиента, количество)]).
+        """
+        if not isinstance(record, dict):
+            raise ValueError('ожидался JSON-объект')
+        name = record.get('name')
+        if (not isinstance(name, str) or not name.strip()
+                or len(name) > RECIPE_NAME_MAX_LENGTH):
+            raise ValueError('некорректное название')
+        text = record.get('text')
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError('пустое описание')
+        cooking_time = record.get('cooking_time')
+        if (not _is_integer(cooking_time)
+                or cooking_time < COOKING_TIME_MIN_VALUE):
+            raise ValueError('некорректное время приготовления')
+
+        author = self.options['author'] or record.get('author')
+        if not isinstance(author, str) or author not in self.authors:
+            raise ValueError(f'автор {author} не найден')
+        image = record.get('image')
+        if (not isinstance(image, str) or not image
+                or not self._image_exists(image)):
+            raise ValueError(f'изображение {image} не найдено')
+        pub_date = record.get('pub_date')
+        if pub_date is not None:
+            pub_date = (parse_datetime(pub_date)
+                        if isinstance(pub_date, str) else None)
+            if pub_date is None:
+                raise ValueError('некорректная дата публикации')
+
+        slugs = record.get('tags')
+        if (not isinstance(slugs, list) or not slugs
+                or not all(isinstance(slug, str) for slug in slugs)):
+            raise ValueError('нет тегов')
+        if len(slugs) != len(set(slugs)):
+            raise ValueError('теги повторяются')
+        unknown = [slug for slug in slugs if slug not in self.tags]
+        if unknown:
+            raise ValueError(f'неизвестные теги {unknown}')
+
+        items = record.get('ingredients')
+        if not isinstance(items, list) or not items:
+            raise ValueError('нет ингредиентов')
+        ingredients = {}
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError('некорректный ингредиент')
+            key = (item.get('name'), item.get('measurement_unit'))
+            if not all(isinstance(value, str) for value in key) or (
+                    key not in self.ingredients):
+                raise ValueError(f'ингредиент {key} не найден')
+            amount = item.get('amount')
+            if not _is_integer(amount) or amount < AMOUNT_MIN_VALUE:
+                raise ValueError(f'некорректное количество {key}')
+            if self.ingredients[key] in ingredients:
+                raise ValueError(f'ингредиент {key} повторяется')
+            ingredients[self.ingredients[key]] = amount
+
+        recipe = Recipe(author_id=self.authors[author], name=name,
+                        text=text, cooking_time=cooking_time, image=image,
+                        short_link=pending_short_link())
+        return (recipe, pub_date, [self.tags[slug] for slug in slugs],
+                list(ingredients.items()))
+
+    def _resolve_authors(self, emails):
+        missing = {email for email in emails
+                   if isinstance(email, str) and email not in self.authors}
+        if missing:
+            self.authors.update(UserModel.objects.filter(
+                email__in=missing).values_list('email', 'pk'))
+
+    def _resolve_ingredients(self, keys):
+        missing = {
+            (name, unit) for name, unit in keys
+            if isinstance(name, str) and isinstance(unit, str)
+            and (name, unit) not in self.ingredients}
+        if not missing:
+            return
+        self._load_ingredients(missing)
+        if self.options['create_ingredients']:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in missing - set(self.ingredients)
+                 if name.strip() and len(name) <= INGREDIENT_NAME_MAX_LENGTH
+                 and unit.strip()
+                 and len(unit) <= MEASUREMENT_UNIT_MAX_LENGTH),
+                ignore_conflicts=True)
+            self._load_ingredients(missing - set(self.ingredients))
+
+    def _load_ingredients(self, keys):
+        for name, unit, pk in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}).values_list(
+                'name', 'measurement_unit', 'pk'):
+            if (name, unit) in keys:
+                self.ingredients[name, unit] = pk
+
+    def _image_exists(self, name):
+        # Одно изображение часто повторяется в каталоге: проверяем
+        # наличие файла один раз
+        if name not in self.images:
+            try:
+                exists = self.storage.exists(name)
+            except SuspiciousFileOperation:
+                raise ValueError(f'недопустимое имя изображения {name}')
+            if exists:
+                self.images.add(name)
+        return name in self.images
+
+    def _reject(self, position, record, error):
+        self.rejected += 1
+        if self.verbosity > 1 or self.rejected <= REJECTED_SHOWN:
+            self.stderr.write(self.style.WARNING(
+                f'Строка {position} отклонена ({error}): '
+                f'{str(record)[:200]}'))
+
+
+def _is_integer(value):
+    # bool в Python - подкласс int: true не должно пройти как 1
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _read(file):
+    """Записи JSON Lines; строка с ошибкой отклоняется целиком."""
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError:
+            yield number, line
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from recipes.counters import COUNTERS, reconcile_counter
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики (избранное, корзина, '
+            'рецепты и подписчики пользователей) и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Размер диапазона pk для одного UPDATE')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать строки с расхождениями')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counter, related_model, related_field in COUNTERS:
+            bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            fixed = 0
+            if bounds['low'] is not None:
+                for start in range(bounds['low'], bounds['high'] + 1,
+                                   batch_size):
+                    with transaction.atomic():
+                        fixed += reconcile_counter(
+                            model, counter, related_model, related_field,
+                            pk_range=(start, start + batch_size - 1),
+                            dry_run=options['dry_run'])
+            verb = 'расхождений' if options['dry_run'] else 'исправлено'
+            self.stdout.write(
+                f'{model._meta.model_name}.{counter}: {verb} {fixed}')
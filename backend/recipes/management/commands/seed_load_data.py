@@ -0,0 +1,303 @@
+import io
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from PIL import Image
+
+from recipes.cache import INGREDIENTS, TAGS, reference_data
+from recipes.counters import COUNTERS, reconcile_counter
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+    Subscription, Tag, UserModel)
+from recipes.short_codes import encode_short_link, pending_short_link
+
+# Префикс имён сгенерированных пользователей: по нему --clear находит
+# ранее созданные данные (рецепты и связи удаляются каскадом)
+USERNAME_PREFIX = 'load_'
+PASSWORD = 'load-test-password'
+IMAGE_NAME = 'recipes/images/load_test.png'
+RECIPE_WORDS = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Запеканка', 'Омлет',
+    'Паста', 'Плов', 'Котлеты', 'Блины', 'Соус', 'Десерт', 'Смузи')
+MEASUREMENT_UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+
+
+def _image_content():
+    """Прозрачный PNG 1x1: одна картинка на все рецепты."""
+    buffer = io.BytesIO()
+    Image.new('RGBA', (1, 1)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+IMAGE_CONTENT = _image_content()
+
+
+class ZipfSampler:
+    """
+    Выбор элементов с вероятностью, убывающей по степенному закону
+    от ранга: небольшая часть рецептов и авторов получает основную
+    долю добавлений в избранное и подписок, как в реальной нагрузке.
+    Ранги перемешиваются, чтобы популярность не совпадала с порядком id.
+    """
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def sample(self, count, exclude=None):
+        """Возвращает до count различных элементов."""
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        # Популярные элементы выпадают повторно, поэтому берём с запасом
+        # и ограничиваем число попыток
+        for _ in range(10):
+            if len(chosen) >= count:
+                break
+            for item in self.rng.choices(
+                    self.items, cum_weights=self.cum_weights,
+                    k=2 * (count - len(chosen))):
+                if item != exclude:
+                    chosen.add(item)
+        return list(chosen)[:count]
+
+
+class Command(BaseCommand):
+    help = ('Генерирует данные для нагрузочного тестирования: пользователей, '
+            'рецепты, ингредиенты рецептов, избранное, корзины и подписки '
+            'с распределением Ципфа. При одинаковом --seed на пустой базе '
+            'данные совпадают. Пример объёма продакшена: --users 100000 '
+            '--recipes 1000000 --ingredients-per-recipe 5 15 --copy')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Сколько ингредиентов создать, если '
+                                 'справочник пуст')
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--tags-per-recipe', type=int, nargs=2,
+                            default=(1, 3), metavar=('MIN', 'MAX'))
+        parser.add_argument('--favorites-per-user', type=int, default=20,
+                            help='Среднее число рецептов в избранном')
+        parser.add_argument('--cart-per-user', type=int, default=5,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--subscriptions-per-user', type=int, default=10,
+                            help='Среднее число подписок')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель степени распределения Ципфа')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--copy', action='store_true',
+                            help='Загружать таблицы связей через COPY '
+                                 '(только PostgreSQL)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее сгенерированные данные '
+                                 'перед загрузкой')
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только на PostgreSQL.')
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+
+        generated = UserModel.objects.filter(
+            username__startswith=USERNAME_PREFIX)
+        if options['clear']:
+            self._step('Удаление старых данных', generated.delete)
+        elif generated.exists():
+            raise CommandError('Сгенерированные данные уже есть, '
+                               'используйте --clear.')
+
+        started = time.monotonic()
+        tag_ids = self._step('Теги', self._ensure_tags)
+        ingredient_ids = self._step('Ингредиенты', self._ensure_ingredients)
+        user_ids = self._step('Пользователи', self._create_users)
+        recipe_ids = self._step(
+            'Рецепты', self._create_recipes, user_ids, tag_ids,
+            ingredient_ids)
+        recipes = ZipfSampler(recipe_ids, options['zipf'], self.rng)
+        self._step('Избранное', self._create_user_links, Favorite, user_ids,
+                   recipes, options['favorites_per_user'], 'recipe_id')
+        self._step('Корзины', self._create_user_links, ShoppingCart,
+                   user_ids, recipes, options['cart_per_user'], 'recipe_id')
+        authors = ZipfSampler(user_ids, options['zipf'], self.rng)
+        self._step('Подписки', self._create_user_links, Subscription,
+                   user_ids, authors, options['subscriptions_per_user'],
+                   'subscribed_to_id')
+        self._step('Счётчики', self._reconcile_counters)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с.'))
+
+    def _step(self, title, function, *args):
+        started = time.monotonic()
+        result = function(*args)
+        self.stdout.write(f'{title}: {time.monotonic() - started:.1f} с')
+        return result
+
+    def _ensure_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in (
+                    ('Завтрак', 'breakfast'), ('Обед', 'lunch'),
+                    ('Ужин', 'dinner'), ('Десерт', 'dessert'),
+                    ('Постное', 'lenten')))
+            reference_data.invalidate(TAGS)
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def _ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=f'Ингредиент {number}',
+                            measurement_unit=self.rng.choice(
+                                MEASUREMENT_UNITS))
+                 for number in range(self.options['ingredients'])),
+                batch_size=self.batch_size)
+            reference_data.invalidate(INGREDIENTS)
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def _create_users(self):
+        # Хэш пароля вычисляется один раз: PBKDF2 для каждого
+        # пользователя занял бы большую часть времени загрузки
+        password = make_password(PASSWORD)
+        users = (
+            UserModel(username=f'{USERNAME_PREFIX}{number}',
+                      email=f'{USERNAME_PREFIX}{number}@example.com',
+                      first_name='Нагрузочный',
+                      last_name=f'Пользователь {number}',
+                      password=password)
+            for number in range(self.options['users']))
+        for batch in _batches(users, self.batch_size):
+            UserModel.objects.bulk_create(batch)
+        return list(UserModel.objects.filter(
+            username__startswith=USERNAME_PREFIX).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def _create_recipes(self, user_ids, tag_ids, ingredient_ids):
+        # Хранилище не запишет картинку повторно, а вернёт имя
+        # по её содержимому. save() уже взял одну ссылку - её получает
+        # первый рецепт, остальные ссылки добавляются по числу рецептов
+        image_name = default_storage.save(IMAGE_NAME,
+                                          ContentFile(IMAGE_CONTENT))
+        authors = ZipfSampler(user_ids, self.options['zipf'], self.rng)
+        ingredients = ZipfSampler(ingredient_ids, self.options['zipf'],
+                                  self.rng)
+        recipe_ids = []
+        for start in range(0, self.options['recipes'], self.batch_size):
+            size = min(self.batch_size, self.options['recipes'] - start)
+            recipes = [
+                Recipe(author_id=author_id,
+                       name=f'{self.rng.choice(RECIPE_WORDS)} '
+                            f'№{start + number}',
+                       text='Описание рецепта для нагрузочного теста.',
+                       image=image_name,
+                       cooking_time=self.rng.randint(5, 240),
+                       short_link=pending_short_link())
+                for number, author_id in enumerate(
+                    self.rng.choices(authors.items,
+                                     cum_weights=authors.cum_weights,
+                                     k=size))]
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes)
+                default_storage.retain(image_name,
+                                       len(recipes) - (start == 0))
+                # bulk_create не вызывает save(): коды ссылок строим
+                # из полученных id, а дату публикации (auto_now_add)
+                # разносим по последнему году
+                for recipe in recipes:
+                    recipe.short_link = encode_short_link(recipe.pk)
+                    recipe.pub_date = self.now - timedelta(
+                        minutes=self.rng.randint(0, 365 * 24 * 60))
+                Recipe.objects.bulk_update(
+                    recipes, ['short_link', 'pub_date'])
+                self._insert(
+                    Recipe.tags.through, ('recipe_id', 'tag_id'),
+                    ((recipe.pk, tag_id) for recipe in recipes
+                     for tag_id in self.rng.sample(tag_ids, min(
+                         len(tag_ids),
+                         self.rng.randint(*self.options['tags_per_recipe'])
+                     ))))
+                self._insert(
+                    IngredientInRecipe,
+                    ('recipe_id', 'ingredient_id', 'amount'),
+                    ((recipe.pk, ingredient_id, self.rng.randint(1, 500))
+                     for recipe in recipes
+                     for ingredient_id in ingredients.sample(
+                         self.rng.randint(
+                             *self.options['ingredients_per_recipe']))))
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+        return recipe_ids
+
+    def _create_user_links(self, model, user_ids, sampler, average, field):
+        """
+        Связи пользователь -> рецепт (или автор): число связей
+        пользователя распределено экспоненциально со средним average.
+        """
+        fields = ['user_id', field]
+        if any(f.name == 'created' for f in model._meta.fields):
+            fields.append('created')
+        rows = (
+            (user_id, target, self.now)[:len(fields)]
+            for user_id in user_ids
+            for target in sampler.sample(
+                int(self.rng.expovariate(1 / average)) if average else 0,
+                exclude=user_id if field == 'subscribed_to_id' else None))
+        with transaction.atomic():
+            self._insert(model, fields, rows)
+
+    def _insert(self, model, fields, rows):
+        """Вставляет строки пачками через bulk_create или COPY."""
+        for batch in _batches(rows, self.batch_size):
+            if self.options['copy']:
+                _copy(model, fields, batch)
+            else:
+                model.objects.bulk_create(
+                    model(**dict(zip(fields, row))) for row in batch)
+
+    def _reconcile_counters(self):
+        # Связи вставлялись в обход API, счётчики пересчитываем по данным
+        for model, counter, related_model, related_field in COUNTERS:
+            bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            if bounds['low'] is None:
+                continue
+            for start in range(bounds['low'], bounds['high'] + 1,
+                               self.batch_size):
+                reconcile_counter(
+                    model, counter, related_model, related_field,
+                    pk_range=(start, start + self.batch_size - 1))
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _copy(model, fields, rows):
+    """
+    Загружает строки в таблицу модели через COPY FROM STDIN.
+    Значения - числа и даты, экранирование не требуется.
+    """
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(field).column)
+        for field in fields)
+    buffer = io.StringIO(''.join(
+        '\t'.join(str(value) for value in row) + '\n' for row in rows))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+            f'({columns}) FROM STDIN', buffer)
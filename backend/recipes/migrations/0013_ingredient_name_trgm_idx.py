@@ -0,0 +1,48 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+INGREDIENT_NAME_TRGM_IDX = GinIndex(
+    OpClass(Upper('name'), name='gin_trgm_ops'),
+    name='ingredient_name_trgm_idx',
+)
+
+
+def add_trigram_index(apps, schema_editor):
+    # GIN-индекс с gin_trgm_ops существует только в PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    schema_editor.add_index(Ingredient, INGREDIENT_NAME_TRGM_IDX)
+
+
+def remove_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    schema_editor.remove_index(Ingredient, INGREDIENT_NAME_TRGM_IDX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_alter_recipe_short_link'),
+    ]
+
+    operations = [
+        # На других СУБД операция ничего не делает
+        TrigramExtension(),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_trigram_index,
+                                     remove_trigram_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='ingredient',
+                    index=INGREDIENT_NAME_TRGM_IDX,
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-17 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_ingredient_name_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(max_length=128, unique=True, verbose_name='Короткая ссылка'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.17 on 2026-10-17 04:54
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Min
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 2000
+# Окно compute_trending по умолчанию: восстановленные даты ставим
+# раньше него, чтобы старые добавления не попали в популярное
+TRENDING_WINDOW = timedelta(days=14)
+
+
+def backfill_dates(apps, schema_editor):
+    """
+    AddField выше заполнила новые поля всех существующих строк одним
+    значением - временем миграции. Раскладываем эти строки по порядку
+    id между регистрацией первого пользователя и началом окна
+    популярности: порядок добавления сохраняется, а в рейтинг старые
+    строки не попадают.
+    """
+    UserModel = apps.get_model('recipes', 'UserModel')
+    end = django.utils.timezone.now() - TRENDING_WINDOW
+    first_joined = UserModel.objects.aggregate(
+        first=Min('date_joined'))['first']
+    start = min(first_joined or end, end)
+    for model_name, field in (('Recipe', 'pub_date'),
+                              ('Favorite', 'created'),
+                              ('ShoppingCart', 'created')):
+        model = apps.get_model('recipes', model_name)
+        # Все строки таблицы созданы до миграции и получили
+        # значение по умолчанию
+        pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        if not pks:
+            continue
+        step = (end - start) / len(pks)
+        for offset in range(0, len(pks), BATCH_SIZE):
+            model.objects.bulk_update(
+                [model(pk=pk, **{field: start + step * number})
+                 for number, pk in enumerate(pks[offset:offset + BATCH_SIZE],
+                                             offset)],
+                [field])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingRecipe',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='recipes.recipe')),
+                ('score', models.FloatField(verbose_name='Рейтинг')),
+                ('computed_at', models.DateTimeField(verbose_name='Дата расчёта')),
+            ],
+            options={
+                'verbose_name': 'Популярный рецепт',
+                'verbose_name_plural': 'Популярные рецепты',
+                'ordering': ('-score',),
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='pub_date',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата публикации'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', 'id'], name='recipe_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cooking_time', 'id'], name='recipe_cooking_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trendingrecipe',
+            index=models.Index(fields=['-score', 'recipe'], name='trending_score_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
-import uuid
-
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import models, transaction
 from django.db.models import UniqueConstraint
+from django.db.models.functions import Upper
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core.exceptions import ValidationError
@@ -19,11 +19,32 @@ from recipes.constants import (
     COOKING_TIME_MIN_VALUE,
     AMOUNT_MIN_VALUE
 )
+from recipes.short_codes import encode_short_link, pending_short_link
 
 from foodgram import settings
 
 
-class UserModel(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Денормализованные счётчики меняются F-выражениями через
+    QuerySet.update() (recipes/counters.py). Из update_fields,
+    переданных в save(), счётчики исключаются, чтобы частичное
+    сохранение не перезаписало их значениями из памяти. Полный save()
+    пишет все поля; расхождения исправляет reconcile_counters.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = [
+                name for name in update_fields
+                if name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class UserModel(CounterFieldsMixin, AbstractUser):
     first_name = models.CharField(max_length=USER_MAX_LENGTH,)
     last_name = models.CharField(max_length=USER_MAX_LENGTH,)
 
@@ -35,6 +56,15 @@ class UserModel(AbstractUser):
     avatar = models.ImageField(upload_to='users/avatars/',
                                blank=True,
                                null=True,)
+    # Уменьшенные копии аватара, строятся в фоне (recipes/images.py)
+    avatar_variants = models.JSONField(default=dict, blank=True,
+                                       editable=False)
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество подписчиков')
+
+    counter_fields = ('recipes_count', 'subscribers_count')
 
     # Используем email в качестве имени пользователя для авторизации
     USERNAME_FIELD = 'email'
@@ -100,6 +130,13 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         unique_together = ('name', 'measurement_unit')
+        indexes = [
+            # Триграммный индекс для автодополнения: ускоряет и поиск
+            # по началу строки, и поиск по вхождению (UPPER(name) LIKE ...).
+            # Создаётся только на PostgreSQL, см. миграцию 0013.
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'),
+                     name='ingredient_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -111,17 +148,24 @@ class ShoppingCart(models.Model):
                              related_name='shopping_cart')
     recipe = models.ForeignKey('Recipe', on_delete=models.CASCADE,
                                related_name='in_cart')
+    created = models.DateTimeField(auto_now_add=True, db_index=True,
+                                   verbose_name='Дата добавления')
 
     class Meta:
         constraints = [
             UniqueConstraint(fields=['user', 'recipe'],
                              name='unique_user_recipe')]
+        indexes = [
+            # Обратное направление к unique (user, recipe): корзины рецепта
+            models.Index(fields=['recipe', 'user'],
+                         name='cart_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.recipe.name}"
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         UserModel, on_delete=models.CASCADE,
         verbose_name='Автор',
@@ -133,6 +177,9 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         null=False
     )
+    # Уменьшенные копии изображения, строятся в фоне (recipes/images.py)
+    image_variants = models.JSONField(default=dict, blank=True,
+                                      editable=False)
     text = models.TextField(verbose_name='Описание',)
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -150,28 +197,60 @@ class Recipe(models.Model):
         max_length=SHORT_LINK_MAX_LENGTH, verbose_name="Короткая ссылка",
         unique=True
     )
+    pub_date = models.DateTimeField(auto_now_add=True,
+                                    verbose_name='Дата публикации')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество добавлений в избранное')
+    in_cart_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Количество добавлений в корзину')
+
+    counter_fields = ('favorites_count', 'in_cart_count')
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # Сортировка ленты и курсорная пагинация по (name, id)
+            models.Index(fields=['name', 'id'], name='recipe_name_id_idx'),
+            # Сортировки ленты ?ordering=popular|newest|cooking_time
+            models.Index(fields=['-favorites_count', 'id'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_newest_idx'),
+            models.Index(fields=['cooking_time', 'id'],
+                         name='recipe_cooking_time_idx'),
+            # Фильтр ?author= с сортировкой по id
+            models.Index(fields=['author', 'id'],
+                         name='recipe_author_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.short_link:
+        if self.short_link:
+            return super().save(*args, **kwargs)
+        if self.pk:
             self.short_link = self.generate_unique_short_url()
-        super().save(*args, **kwargs)
+            return super().save(*args, **kwargs)
+        # Код строится из id, который известен только после вставки:
+        # вставляем с временным уникальным кодом и сразу заменяем его
+        with transaction.atomic():
+            self.short_link = pending_short_link()
+            super().save(*args, **kwargs)
+            self.short_link = self.generate_unique_short_url()
+            Recipe.objects.filter(pk=self.pk).update(
+                short_link=self.short_link)
 
     def generate_unique_short_url(self):
         """
-        Генерация уникальной короткой ссылки.
+        Генерация уникальной короткой ссылки из id рецепта
+        без обращений к БД.
         """
-        while True:
-            short_link = str(uuid.uuid4())[:8]  # Генерируем короткую ссылку
-            if not Recipe.objects.filter(short_link=short_link).exists():
-                return short_link
+        return encode_short_link(self.pk)
 
     def get_absolute_url(self):
         # Возвращаем полный URL для отображения рецепта
@@ -199,11 +278,60 @@ class Favorite(models.Model):
                              related_name='favorites')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                related_name='favorites')
+    created = models.DateTimeField(auto_now_add=True, db_index=True,
+                                   verbose_name='Дата добавления')
 
     class Meta:
         constraints = [
             UniqueConstraint(fields=['user', 'recipe'],
                              name='unique_fav_user_recipe')]
+        indexes = [
+            # Обратное направление к unique (user, recipe): избранное рецепта
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f'Рецепт "{self.recipe}" в избранном у {self.user}'
+
+
+class StoredFile(models.Model):
+    """
+    Счётчик ссылок на файл в хранилище с адресацией по содержимому
+    (foodgram/storage.py): файл удаляется, когда ссылок не остаётся.
+    """
+    name = models.CharField(max_length=255, unique=True,
+                            verbose_name='Имя файла')
+    references = models.PositiveIntegerField(default=0,
+                                             verbose_name='Ссылок')
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+
+class TrendingRecipe(models.Model):
+    """
+    Предрассчитанный рейтинг популярных в последнее время рецептов.
+    Заполняется командой compute_trending.
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='trending')
+    score = models.FloatField(verbose_name='Рейтинг')
+    computed_at = models.DateTimeField(verbose_name='Дата расчёта')
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'Популярный рецепт'
+        verbose_name_plural = 'Популярные рецепты'
+        indexes = [
+            models.Index(fields=['-score', 'recipe'],
+                         name='trending_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ({self.score:.2f})'
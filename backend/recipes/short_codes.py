@@ -0,0 +1,79 @@
+"""
+Детерминированные коды коротких ссылок.
+
+Код строится из id рецепта: id переставляется шифром Фейстеля
+с ключом settings.SHORT_LINK_SECRET (соседние id дают непохожие коды)
+и записывается в base62 фиксированной длины. Перестановка взаимно
+однозначна, поэтому коды разных рецептов не совпадают и проверять
+уникальность запросом к БД не нужно. Длина кода (7) отличается от
+длины старых кодов из uuid4 (8), так что новые коды не пересекаются
+и с ними.
+"""
+import hashlib
+import string
+import uuid
+
+from django.conf import settings
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 7
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+# 2 ** 40 < 62 ** 7, поэтому любой переставленный id помещается в код
+MAX_ID = (1 << (2 * HALF_BITS)) - 1
+ROUNDS = 4
+PENDING_LENGTH = 32
+# Старые коды - первые 8 символов uuid4
+LEGACY_ALPHABET = '0123456789abcdef'
+LEGACY_LENGTH = 8
+
+
+def _round_function(value, round_number):
+    digest = hashlib.blake2b(
+        f'{round_number}:{value}'.encode(),
+        key=settings.SHORT_LINK_SECRET.encode(),
+        digest_size=4,
+    ).digest()
+    return int.from_bytes(digest, 'big') & HALF_MASK
+
+
+def _permute(number):
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in range(ROUNDS):
+        left, right = right, left ^ _round_function(right, round_number)
+    return (left << HALF_BITS) | right
+
+
+def encode_short_link(recipe_id):
+    """Возвращает код короткой ссылки для id рецепта."""
+    if not 0 < recipe_id <= MAX_ID:
+        raise ValueError(f'id рецепта вне допустимого диапазона: {recipe_id}')
+    number = _permute(recipe_id)
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, remainder = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def pending_short_link():
+    """
+    Временный уникальный код для вставки рецепта, пока его id
+    ещё не известен.
+    """
+    return uuid.uuid4().hex
+
+
+def is_pending_short_link(short_link):
+    return len(short_link) == PENDING_LENGTH
+
+
+def is_valid_short_link(short_link):
+    """Может ли строка быть кодом рецепта: новым или старым из uuid4."""
+    if len(short_link) == CODE_LENGTH:
+        alphabet = ALPHABET
+    elif len(short_link) == LEGACY_LENGTH:
+        alphabet = LEGACY_ALPHABET
+    else:
+        return False
+    return all(char in alphabet for char in short_link)
@@ -0,0 +1,64 @@
+"""
+Короткие ссылки на рецепты.
+
+resolve_short_link() читает из БД только id рецепта и кэширует
+соответствие short_link -> id, в том числе отсутствие рецепта
+(на короткое время, чтобы новый рецепт с этим кодом быстро стал
+доступен). Строки, которые не могут быть кодом, отклоняются до
+обращения к кэшу и БД и не засоряют кэш. write_nginx_map()
+выгружает соответствия в map-файл nginx, чтобы переходы
+по ссылкам обслуживались без Django.
+"""
+from recipes.cache import recipe_data
+from recipes.models import Recipe
+from recipes.short_codes import is_valid_short_link
+
+SHORT_LINK_KEY = 'short_link:{}'
+# Сколько секунд помнить, что рецепта с таким кодом нет
+MISSING_SHORT_LINK_TIMEOUT = 60
+# Значение в кэше для отсутствующего кода (None означает промах кэша)
+MISSING = 0
+
+
+def recipe_url(recipe_id):
+    """Адрес страницы рецепта во фронтенде."""
+    return f'/recipes/{recipe_id}'
+
+
+def resolve_short_link(short_link):
+    """Возвращает id рецепта по короткой ссылке или None."""
+    if not is_valid_short_link(short_link):
+        return None
+    key = SHORT_LINK_KEY.format(short_link)
+    recipe_id = recipe_data.get(key)
+    if recipe_id is None:
+        recipe_id = Recipe.objects.filter(
+            short_link=short_link
+        ).values_list('id', flat=True).first()
+        if recipe_id is None:
+            recipe_data.set(key, MISSING, MISSING_SHORT_LINK_TIMEOUT)
+        else:
+            recipe_data.set(key, recipe_id)
+    return recipe_id or None
+
+
+def forget_short_link(short_link):
+    """Удаляет соответствие из кэша (рецепт создан или удалён)."""
+    recipe_data.delete(SHORT_LINK_KEY.format(short_link))
+
+
+def write_nginx_map(file, chunk_size=2000):
+    """
+    Пишет строки map-файла nginx вида '/r/<код>/ /recipes/<id>;'
+    для всех рецептов, возвращает число рецептов.
+    """
+    count = 0
+    short_links = Recipe.objects.order_by().values_list(
+        'short_link', 'id').iterator(chunk_size=chunk_size)
+    for short_link, recipe_id in short_links:
+        target = recipe_url(recipe_id)
+        # Django принимает ссылку и без завершающего слэша (APPEND_SLASH)
+        file.write(f'/r/{short_link}/ {target};\n'
+                   f'/r/{short_link} {target};\n')
+        count += 1
+    return count
@@ -0,0 +1,154 @@
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_save)
+from django.dispatch import receiver
+
+from recipes.cache import (
+    INGREDIENTS, TAGS, recipe_data, recipe_group, reference_data,
+    user_data, user_group)
+from recipes.counters import COUNTERS, change_counter
+from recipes.images import (
+    IMAGE_SPECS, clear_variants, image_files, needs_variants, release_files,
+    schedule_variants, stored_image)
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+    Subscription, Tag, UserModel)
+from recipes.short_links import forget_short_link
+
+
+def _invalidate_on_commit(cache, group):
+    """
+    Сбрасывает группу кэша после фиксации транзакции, чтобы
+    параллельный запрос не закэшировал данные до коммита.
+    """
+    transaction.on_commit(lambda: cache.invalidate(group))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+def increase_counters(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счётчики, которые учитывают созданную связь."""
+    if created and not raw:
+        _change_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+def decrease_counters(sender, instance, **kwargs):
+    """
+    Уменьшает счётчики при удалении связи, в том числе каскадном
+    и из админки.
+    """
+    _change_counters(sender, instance, -1)
+
+
+def _change_counters(sender, instance, delta):
+    for model, counter, related_model, related_field in COUNTERS:
+        if related_model is sender:
+            change_counter(model, getattr(instance, f'{related_field}_id'),
+                           counter, delta)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    """Сбрасывает кэш тегов при любом изменении тега."""
+    _invalidate_on_commit(reference_data, TAGS)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    """Сбрасывает кэш ингредиентов при любом изменении ингредиента."""
+    _invalidate_on_commit(reference_data, INGREDIENTS)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """Сбрасывает кэш рецепта при его изменении или удалении."""
+    _invalidate_on_commit(recipe_data, recipe_group(instance.pk))
+    # Код читается после фиксации: новый рецепт сохраняется
+    # с временным кодом, постоянный Recipe.save() пишет позже
+    transaction.on_commit(lambda: forget_short_link(instance.short_link))
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    """Сбрасывает кэш рецепта при изменении его ингредиентов."""
+    _invalidate_on_commit(recipe_data, recipe_group(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Сбрасывает кэш рецептов при изменении набора их тегов."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _invalidate_on_commit(recipe_data, recipe_group(instance.pk))
+        return
+    # Изменение со стороны тега: затронутые рецепты берём из pk_set,
+    # а при очистке - до неё, пока связи ещё существуют
+    if action == 'pre_clear':
+        recipe_ids = list(instance.recipe_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        recipe_ids = pk_set
+    else:
+        return
+    for recipe_id in recipe_ids:
+        _invalidate_on_commit(recipe_data, recipe_group(recipe_id))
+
+
+@receiver((post_save, post_delete), sender=UserModel)
+def invalidate_user(sender, instance, **kwargs):
+    """Сбрасывает кэш профиля пользователя при его изменении."""
+    _invalidate_on_commit(user_data, user_group(instance.pk))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=UserModel)
+def remember_stored_image(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    """
+    Запоминает сохранённое изображение, чтобы после замены
+    освободить его файлы. Варианты того же изображения берутся
+    из БД: их записывает фоновый поток, и в памяти они могут
+    быть устаревшими.
+    """
+    spec = IMAGE_SPECS[sender]
+    if raw or instance._state.adding or (
+            update_fields is not None and spec.field not in update_fields):
+        return
+    stored = stored_image(instance)
+    instance._stored_image = stored
+    if stored and stored[0] == getattr(instance, spec.field).name:
+        setattr(instance, spec.variants_field, stored[1])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=UserModel)
+def build_image_variants(sender, instance, **kwargs):
+    """
+    Ставит в очередь построение вариантов нового изображения
+    или убирает варианты, если изображение удалено. Файлы прежнего
+    изображения освобождаются в фоне.
+    """
+    stored = instance.__dict__.pop('_stored_image', None)
+    if stored and stored[0] != getattr(
+            instance, IMAGE_SPECS[sender].field).name:
+        release_files(sender, image_files(*stored))
+    if needs_variants(instance):
+        schedule_variants(instance)
+    elif not getattr(instance, IMAGE_SPECS[sender].field):
+        clear_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=UserModel)
+def release_image_files(sender, instance, **kwargs):
+    """Освобождает в фоне файлы изображения удалённого объекта."""
+    spec = IMAGE_SPECS[sender]
+    release_files(sender, image_files(
+        getattr(instance, spec.field).name,
+        getattr(instance, spec.variants_field)))
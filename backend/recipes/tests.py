@@ -0,0 +1,320 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+
+from recipes.images import build_variants, image_files
+from recipes.management.commands import import_ingredients
+from recipes.models import (
+    Ingredient, IngredientInRecipe, Recipe, StoredFile, Tag, UserModel)
+
+IMAGE_NAME = 'recipes/images/test.png'
+
+
+def image_content(color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class InlineExecutor:
+    """Выполняет задачи фонового пула сразу, в потоке теста."""
+
+    def submit(self, function, *args):
+        function(*args)
+
+
+class MediaMixin:
+    """Медиафайлы теста пишутся во временный каталог."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.author = UserModel.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+
+    def create_recipe(self, color='white'):
+        image = default_storage.save(IMAGE_NAME,
+                                     ContentFile(image_content(color)))
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            image=image, cooking_time=5)
+
+
+class StorageReferencesTests(MediaMixin, TestCase):
+
+    def save(self, color='white'):
+        return default_storage.save(IMAGE_NAME,
+                                    ContentFile(image_content(color)))
+
+    def test_same_content_shares_file(self):
+        name = self.save()
+        self.assertEqual(self.save(), name)
+        self.assertNotEqual(self.save('black'), name)
+        self.assertEqual(default_storage.references(name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(default_storage.references(name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertIsNone(default_storage.references(name))
+
+    def test_save_before_removal_keeps_file(self):
+        name = self.save()
+        with self.captureOnCommitCallbacks() as callbacks:
+            default_storage.delete(name)
+        # То же содержимое сохранили до того, как удаление
+        # после фиксации транзакции дошло до файла
+        self.assertEqual(self.save(), name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(default_storage.references(name), 1)
+
+
+class ImageVariantsTests(MediaMixin, TestCase):
+
+    def test_replaced_original_releases_variants(self):
+        recipe = self.create_recipe()
+        name = recipe.image.name
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image=default_storage.save(
+                IMAGE_NAME, ContentFile(image_content('black'))))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(build_variants(Recipe, recipe.pk, name))
+        self.assertFalse(StoredFile.objects.filter(
+            name__contains='/variants/').exists())
+        self.assertEqual(
+            [file_name for _, _, names in os.walk(default_storage.path(
+                'recipes/images/variants')) for file_name in names], [])
+
+    def test_save_keeps_built_variants(self):
+        recipe = self.create_recipe()
+        variants = build_variants(Recipe, recipe.pk, recipe.image.name)
+        self.assertEqual(variants['source'], recipe.image.name)
+
+        # В памяти остались варианты до построения
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.image_variants, variants)
+
+
+class CollectMediaTests(MediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        recipe = self.create_recipe()
+        variants = build_variants(Recipe, recipe.pk, recipe.image.name)
+        self.referenced = image_files(recipe.image.name, variants)
+        self.orphan = default_storage.save(
+            IMAGE_NAME, ContentFile(image_content('black')))
+        self.variant_orphan = default_storage.save(
+            'recipes/images/variants/card.webp', ContentFile(b'variant'))
+        # Все файлы старше --min-age
+        old = time.time() - 2 * 60 * 60
+        for name in (*self.referenced, self.orphan, self.variant_orphan):
+            os.utime(default_storage.path(name), (old, old))
+        # Свежий файл команда не проверяет
+        self.scanned = len(set(self.referenced)) + 2
+        self.fresh = default_storage.save(
+            IMAGE_NAME, ContentFile(image_content('red')))
+
+    def collect(self, *args):
+        output = io.StringIO()
+        call_command('collect_media', *args, stdout=output)
+        return output.getvalue()
+
+    def test_removes_orphans(self):
+        output = self.collect()
+        self.assertIn(f'recipe: проверено {self.scanned}, удалено 2', output)
+        for name in (self.orphan, self.variant_orphan):
+            self.assertFalse(default_storage.exists(name))
+            self.assertIsNone(default_storage.references(name))
+        for name in (*self.referenced, self.fresh):
+            self.assertTrue(default_storage.exists(name))
+
+    def test_dry_run(self):
+        output = self.collect('--dry-run')
+        self.assertIn(
+            f'recipe: проверено {self.scanned}, будет удалено 2', output)
+        for name in (*self.referenced, self.orphan, self.variant_orphan,
+                     self.fresh):
+            self.assertTrue(default_storage.exists(name))
+
+
+@mock.patch('recipes.images._executor', InlineExecutor())
+class ImageReleaseTests(MediaMixin, TransactionTestCase):
+    """Файлы освобождаются по ссылкам при удалении объектов."""
+
+    def test_shared_image(self):
+        first, second = self.create_recipe(), self.create_recipe()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image_variants, second.image_variants)
+        # Маленькая картинка не уменьшается: варианты разных размеров
+        # совпадают, и на каждое вхождение файла своя ссылка
+        files = Counter(image_files(first.image.name, first.image_variants))
+        self.assertEqual(sum(files.values()), 7)
+        for name, count in files.items():
+            self.assertEqual(default_storage.references(name), 2 * count)
+
+        first.delete()
+        for name, count in files.items():
+            self.assertTrue(default_storage.exists(name))
+            self.assertEqual(default_storage.references(name), count)
+
+        second.delete()
+        for name in files:
+            self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_replaced_image(self):
+        recipe = self.create_recipe()
+        recipe.refresh_from_db()
+        old_files = image_files(recipe.image.name, recipe.image_variants)
+
+        recipe.image = default_storage.save(
+            IMAGE_NAME, ContentFile(image_content('black')))
+        recipe.save()
+        recipe.refresh_from_db()
+        for name in old_files:
+            self.assertFalse(default_storage.exists(name))
+        self.assertEqual(recipe.image_variants['source'], recipe.image.name)
+        self.assertEqual(
+            StoredFile.objects.count(),
+            len(set(image_files(recipe.image.name, recipe.image_variants))))
+
+
+class ImportIngredientsTests(TestCase):
+    ROWS = [['Соль', 'г'], ['  Сахар ', 'кг'], ['', 'г']]
+    FILES = {
+        'csv': 'name,measurement_unit\n'
+               + ''.join(f'{name},{unit}\n' for name, unit in ROWS),
+        'json': json.dumps([{'name': name, 'measurement_unit': unit}
+                            for name, unit in ROWS]),
+        'jsonl': ''.join(json.dumps(row) + '\n' for row in ROWS),
+    }
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.directory = directory
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, path):
+        output = io.StringIO()
+        call_command('import_ingredients', path=path, stdout=output,
+                     stderr=io.StringIO())
+        return output.getvalue()
+
+    def test_formats(self):
+        for file_format, content in self.FILES.items():
+            with self.subTest(file_format=file_format):
+                Ingredient.objects.all().delete()
+                path = self.write(f'ingredients.{file_format}', content)
+                self.assertIn('Прочитано 3, добавлено 2, пропущено 0, '
+                              'отклонено 1', self.run_import(path))
+                self.assertEqual(
+                    sorted(Ingredient.objects.values_list(
+                        'name', 'measurement_unit')),
+                    [('Сахар', 'кг'), ('Соль', 'г')])
+                # Повторный импорт ничего не добавляет
+                self.assertIn('Прочитано 3, добавлено 0, пропущено 2',
+                              self.run_import(path))
+                self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_concurrent_insert(self):
+        path = self.write('ingredients.csv', self.FILES['csv'])
+        # Строку вставил параллельный импорт уже после проверки
+        # существующих ингредиентов
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        with mock.patch.object(Ingredient.objects, 'filter',
+                               return_value=Ingredient.objects.none()):
+            self.assertIn('Прочитано 3, добавлено 1, пропущено 1',
+                          self.run_import(path))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_malformed_json_element(self):
+        path = self.write('ingredients.json', '[{"name": "Соль"}, {"name": ]')
+        with self.assertRaisesMessage(CommandError, 'элемент 2'):
+            self.run_import(path)
+
+    def test_malformed_json_stops_reading(self):
+        valid = json.dumps({'name': 'Соль', 'measurement_unit': 'г'})
+        file = io.StringIO(f'[{valid}, {{"name": oops}}, '
+                           + ', '.join([valid] * 50000) + ']')
+        with self.assertRaisesMessage(ValueError, 'элемент 2'):
+            list(import_ingredients._read_json(file))
+        self.assertLessEqual(file.tell(), 2 * import_ingredients.READ_SIZE)
+
+
+class RecipesExportImportTests(MediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe()
+        self.recipe.tags.set([
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)])
+        for number in range(3):
+            IngredientInRecipe.objects.create(
+                recipe=self.recipe, amount=number + 1,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit='г'))
+        self.path = os.path.join(default_storage.location, 'recipes.jsonl')
+
+    def export(self):
+        call_command('export_recipes', output=self.path,
+                     stdout=io.StringIO())
+        with open(self.path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_round_trip(self):
+        [record] = self.export()
+        invalid = [
+            {**record, 'cooking_time': True},
+            {**record, 'image': '../../settings.py'},
+            {**record, 'ingredients': [
+                {**record['ingredients'][0], 'amount': True}]},
+        ]
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for line in invalid:
+                file.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+        output = io.StringIO()
+        call_command('import_recipes', path=self.path, stdout=output,
+                     stderr=io.StringIO())
+        self.assertIn('Загружено рецептов 1, отклонено 3', output.getvalue())
+
+        first, second = self.export()
+        self.assertEqual(first, record)
+        self.assertEqual(second, record)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        self.assertEqual(default_storage.references(record['image']), 2)
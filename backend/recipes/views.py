@@ -1,7 +1,8 @@
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404
+from django.shortcuts import redirect
 from django.views.decorators.http import require_http_methods
 
-from recipes.models import Recipe
+from recipes.short_links import recipe_url, resolve_short_link
 
 
 @require_http_methods(["GET"])
@@ -10,7 +11,9 @@ def redirect_short_link(request, short_link):
     Обрабатывает переход по короткой ссылке и переадресовывает
     на оригинальный рецепт.
     """
-    # Ищем рецепт по короткой ссылке
-    recipe = get_object_or_404(Recipe, short_link=short_link)
+    # Ищем id рецепта по короткой ссылке (с кэшированием)
+    recipe_id = resolve_short_link(short_link)
+    if recipe_id is None:
+        raise Http404('Рецепт не найден.')
     # Переадресовываем на оригинальный URL рецепта
-    return redirect(f"/recipes/{recipe.id}")
\ No newline at end of file
+    return redirect(recipe_url(recipe_id))